@@ -0,0 +1,277 @@
+"""
+Batch evaluation of many positions.
+
+Positions are given either as an ordered list of moves (black first) or as a
+frontend pieces list. 'raw' analysis evaluates all positions with a single
+batched policy_value call; 'search' analysis runs an independent MCTS per
+position on a thread pool. Both return, per position, the policy over the
+board, the value for the side to move and the best move. 'value' analysis
+returns the value alone and 'rank' analysis scores every legal move by the
+value of the position it leads to; both use the value-only network path.
+"""
+
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from .game_3d import Board3D, winning_lines
+    from .mcts_alphaZero_3d import MCTS3D
+except ImportError:
+    from game_3d import Board3D, winning_lines
+    from mcts_alphaZero_3d import MCTS3D
+
+
+def new_board(width=4, height=4, depth=4, n_in_row=4):
+    board = Board3D(width=width, height=height, depth=depth, n_in_row=n_in_row)
+    board.init_board(0)  # black always moves first
+    return board
+
+
+def piece_to_move(board, piece):
+    pos = piece['position']
+    return parse_move(board, (pos['z'], pos['y'], pos['x']))
+
+
+def pieces_to_moves(pieces, board):
+    """Order a frontend pieces list into a move list, alternating black and
+    white in the order each colour appears in the list
+    """
+    black_pieces = [p for p in pieces if p['color'] == 'black']
+    white_pieces = [p for p in pieces if p['color'] == 'white']
+
+    # Black always starts, so we should have equal or one more black piece
+    if len(black_pieces) < len(white_pieces):
+        raise ValueError("Invalid game state: white has more pieces than black")
+
+    if len(black_pieces) > len(white_pieces) + 1:
+        raise ValueError("Invalid game state: black has too many extra pieces")
+
+    moves = []
+    for i in range(len(black_pieces)):
+        moves.append(piece_to_move(board, black_pieces[i]))
+        if i < len(white_pieces):
+            moves.append(piece_to_move(board, white_pieces[i]))
+    return moves
+
+
+def parse_move(board, move):
+    """A move is either a move index or a [depth, height, width] location"""
+    if isinstance(move, (list, tuple)):
+        if len(move) != 3 or not all(0 <= c < size for c, size in
+                                     zip(move, (board.depth, board.height, board.width))):
+            raise ValueError("Invalid location {!r}: off the board".format(list(move)))
+        return board.location_to_move(move)
+    return move
+
+
+def board_from_moves(moves, **board_kwargs):
+    """Rebuild a board from an ordered move list, black first"""
+    board = new_board(**board_kwargs)
+    board.load_moves([parse_move(board, move) for move in moves])
+    return board
+
+
+def position_to_board(position, **board_kwargs):
+    """Build a board from a position record holding 'moves' or 'pieces'"""
+    if 'moves' in position:
+        return board_from_moves(position['moves'], **board_kwargs)
+    if 'pieces' in position:
+        board = new_board(**board_kwargs)
+        return board_from_moves(pieces_to_moves(position['pieces'], board), **board_kwargs)
+    raise ValueError("Position needs either 'moves' or 'pieces'")
+
+
+def _result(board, move_probs, value):
+    best_move = int(np.argmax(move_probs))
+    d, h, w = board.move_to_location(best_move)
+    return {
+        'policy': [float(p) for p in move_probs],
+        'value': float(value),
+        'bestMove': best_move,
+        'bestLocation': {'x': int(w), 'y': int(h), 'z': int(d)},
+    }
+
+
+def evaluate_positions(policy_value_net, boards):
+    """Evaluate all boards with one batched network call. The policy is
+    restricted to the legal moves and renormalised.
+    """
+    if not boards:
+        return []
+    act_probs, values = policy_value_net.policy_value(_state_batch(boards))
+    results = []
+    for board, probs, value in zip(boards, act_probs, values):
+        move_probs = np.zeros_like(probs)
+        move_probs[board.availables] = probs[board.availables]
+        total = move_probs.sum()
+        if total > 0:
+            move_probs /= total
+        results.append(_result(board, move_probs, value[0]))
+    return results
+
+
+def _state_batch(boards):
+    return np.ascontiguousarray(
+        np.stack([board.current_state() for board in boards]), dtype=np.float32)
+
+
+def evaluate_values(policy_value_net, boards):
+    """Value for the side to move of every board, from one value-only call"""
+    if not boards:
+        return []
+    values = policy_value_net.value_only(_state_batch(boards))
+    return [{'value': float(value[0])} for value in values]
+
+
+def rank_moves(policy_value_net, boards):
+    """Score every legal move of every board by the value of the resulting
+    position for the player making it. All child positions are evaluated
+    with one value-only call; moves that win outright score 1.
+    """
+    if not boards:
+        return []
+    board = boards[0]
+    n_cells = board.width * board.height * board.depth
+    lines = winning_lines(board.width, board.height, board.depth, board.n_in_row)
+    parents = _state_batch(boards).reshape(len(boards), 4, n_cells)
+    owners, moves = [], []
+    for i, board in enumerate(boards):
+        owners.extend([i] * len(board.availables))
+        moves.extend(board.availables)
+    owners = np.array(owners)
+    moves = np.array(moves)
+    rows = np.arange(len(moves))
+
+    # the position after each move, seen from the opponent who is to move next
+    parent = parents[owners]
+    children = np.zeros_like(parent)
+    children[:, 0] = parent[:, 1]
+    children[:, 1] = parent[:, 0]
+    children[rows, 1, moves] = 1.0
+    children[rows, 2, moves] = 1.0
+    children[:, 3] = 1.0 - parent[:, 3]
+    wins = (children[:, 1][:, lines] == 1.0).all(axis=2).any(axis=1)
+    full = children[:, :2].sum(axis=1).all(axis=1)
+
+    scores = np.ones(len(moves))
+    open_rows = np.nonzero(~wins)[0]
+    if len(open_rows):
+        values = policy_value_net.value_only(children[open_rows].reshape(
+            len(open_rows), 4, board.depth, board.height, board.width))
+        scores[open_rows] = -values[:, 0]
+    scores[~wins & full] = 0.0
+
+    results = []
+    for i, board in enumerate(boards):
+        mine = owners == i
+        move_values = [None] * n_cells
+        for move, score in zip(moves[mine], scores[mine]):
+            move_values[int(move)] = float(score)
+        best_move = int(moves[mine][np.argmax(scores[mine])])
+        d, h, w = board.move_to_location(best_move)
+        results.append({
+            'moveValues': move_values,
+            'value': float(scores[mine].max()),
+            'bestMove': best_move,
+            'bestLocation': {'x': int(w), 'y': int(h), 'z': int(d)},
+        })
+    return results
+
+
+def search_position(policy_value_fn, board, n_playout, c_puct=5):
+    """Run one MCTS search and return visit probabilities and the value of
+    the most visited move for the side to move
+    """
+    mcts = MCTS3D(policy_value_fn, n_playout, c_puct)
+    mcts.get_move_probs(board)
+    size = board.width * board.height * board.depth
+    visits = np.zeros(size)
+    for act, node in mcts._root._children.items():
+        visits[act] = node._n_visits
+    best = mcts._root._children[int(np.argmax(visits))]
+    return _result(board, visits / visits.sum(), best._Q)
+
+
+def search_positions(policy_value_fn, boards, n_playout, c_puct=5, n_workers=4, pool=None):
+    """Run an independent search for every board on a thread pool"""
+    def run(board):
+        return search_position(policy_value_fn, board, n_playout, c_puct)
+    if pool is not None:
+        return list(pool.map(run, boards))
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        return list(pool.map(run, boards))
+
+
+def analyze_positions(positions, policy_value_net, mode='raw', n_playout=200,
+                      c_puct=5, n_workers=4, pool=None, **board_kwargs):
+    """Analyze a list of position records. Positions that cannot be built or
+    are already decided get an 'error' entry instead of a result.
+    """
+    results = [None] * len(positions)
+    boards, index = [], []
+    for i, position in enumerate(positions):
+        try:
+            if not isinstance(position, dict):
+                raise TypeError("Position must be an object, got {!r}".format(position))
+            board = position_to_board(position, **board_kwargs)
+        except (ValueError, KeyError, TypeError) as e:
+            results[i] = {'error': str(e)}
+            continue
+        end, winner = board.game_end()
+        if end:
+            results[i] = {'error': 'Game is already over', 'winner': winner}
+            continue
+        boards.append(board)
+        index.append(i)
+
+    if mode == 'raw':
+        evaluated = evaluate_positions(policy_value_net, boards)
+    elif mode == 'value':
+        evaluated = evaluate_values(policy_value_net, boards)
+    elif mode == 'rank':
+        evaluated = rank_moves(policy_value_net, boards)
+    elif mode == 'search':
+        evaluated = search_positions(policy_value_net.policy_value_fn, boards,
+                                     n_playout, c_puct, n_workers, pool)
+    else:
+        raise ValueError("Unknown analysis mode: {}".format(mode))
+
+    for i, res in zip(index, evaluated):
+        results[i] = res
+    for position, res in zip(positions, results):
+        if isinstance(position, dict) and 'id' in position:
+            res['id'] = position['id']
+    return results
+
+
+def iter_positions(lines):
+    """Parse position records from an iterable of JSON lines, skipping
+    blank lines
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def analyze_stream(positions, policy_value_net, batch_size=256, **kwargs):
+    """Analyze an iterable of positions batch by batch, yielding results in
+    input order. Only one batch is held in memory at a time.
+    """
+    positions = iter(positions)
+    mode = kwargs.get('mode', 'raw')
+    n_workers = kwargs.pop('n_workers', 4)
+    pool = ThreadPoolExecutor(max_workers=n_workers) if mode == 'search' else None
+    try:
+        while True:
+            batch = list(itertools.islice(positions, batch_size))
+            if not batch:
+                break
+            for res in analyze_positions(batch, policy_value_net, pool=pool, **kwargs):
+                yield res
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,78 @@
+"""
+Batch analysis of recorded positions.
+
+Reads one JSON position per line, e.g.
+    {"id": "g1-12", "moves": [21, 42, 22, [1, 1, 3]]}
+    {"id": "g2-7", "pieces": [{"color": "black", "position": {"x": 1, "y": 1, "z": 1}}]}
+and writes one JSON result per line with the policy, value and best move.
+
+    python analyze_games.py positions.jsonl -o results.jsonl
+    python analyze_games.py positions.jsonl --mode search --n-playout 400 --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+
+os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import logging
+import numpy as np
+import tensorflow as tf
+
+from analysis import analyze_stream, iter_positions
+from policy_value_net_tf2_3d import PolicyValueNet3D
+
+tf.get_logger().setLevel(logging.ERROR)
+tf.keras.utils.disable_interactive_logging()
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Evaluate many 3D Gomoku positions')
+    parser.add_argument('input', help="JSON lines file of positions, or '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="output file, or '-' for stdout")
+    parser.add_argument('--model', default='./policy_3d_iter_100_2nd.weights.h5')
+    parser.add_argument('--mode', choices=('raw', 'search', 'value', 'rank'), default='raw',
+                        help='raw network evaluation, a full MCTS per position, the value '
+                             'alone, or every legal move ranked by its resulting value')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='positions held in memory and evaluated together')
+    parser.add_argument('--n-playout', type=int, default=200)
+    parser.add_argument('--c-puct', type=float, default=4)
+    parser.add_argument('--workers', type=int, default=4, help='parallel searches in search mode')
+    parser.add_argument('--size', type=int, default=4, help='board width, height and depth')
+    parser.add_argument('--n-in-row', type=int, default=4)
+    args = parser.parse_args()
+
+    size = args.size
+    policy = PolicyValueNet3D(size, size, size)
+    policy(np.zeros((1, 4, size, size, size)))
+    policy.load_weights(args.model)
+
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    n = 0
+    try:
+        results = analyze_stream(iter_positions(infile), policy,
+                                 batch_size=args.batch_size,
+                                 mode=args.mode,
+                                 n_playout=args.n_playout,
+                                 c_puct=args.c_puct,
+                                 n_workers=args.workers,
+                                 width=size, height=size, depth=size,
+                                 n_in_row=args.n_in_row)
+        for res in results:
+            outfile.write(json.dumps(res) + '\n')
+            n += 1
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    print("Analyzed {} positions".format(n), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    run()
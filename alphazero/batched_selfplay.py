@@ -0,0 +1,303 @@
+"""
+Batched self-play: many games advanced in lockstep in one process.
+
+The boards of all active games live in stacked NumPy arrays (BoardBatch).
+Every step collects one or more leaves from each game's search tree,
+checks them for a win with a vectorised test over all winning lines,
+evaluates the non-terminal ones with a single PolicyValueNet3D batch and
+backs the values up. Games that finish are replaced from the queue, so the
+network keeps seeing batches of about n_concurrent * leaves_per_game
+states. Several leaves per game are collected with virtual loss.
+
+    python batched_selfplay.py --games 1000 --concurrent 256 --output selfplay.gmr
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+try:
+    from .game_3d import winning_lines
+    from .game_record import GameRecord
+    from .mcts_alphaZero_3d import LazyTreeNode, softmax
+    from .metrics import METRICS
+except ImportError:
+    from game_3d import winning_lines
+    from game_record import GameRecord
+    from mcts_alphaZero_3d import LazyTreeNode, softmax
+    from metrics import METRICS
+
+
+class BoardBatch(object):
+    """Stacked boards. stones[g, move] is 0 for empty or the player (1 or 2)
+    who played there; players alternate starting with player 1.
+    """
+
+    def __init__(self, n_boards, width=4, height=4, depth=4, n_in_row=4):
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.n_cells = width * height * depth
+        self.lines = winning_lines(width, height, depth, n_in_row)
+        self.stones = np.zeros((n_boards, self.n_cells), dtype=np.int8)
+        self.last_move = np.full(n_boards, -1, dtype=np.intp)
+        self.n_moves = np.zeros(n_boards, dtype=np.intp)
+
+    def reset(self, g):
+        self.stones[g] = 0
+        self.last_move[g] = -1
+        self.n_moves[g] = 0
+
+    def current_player(self, g):
+        return 1 + self.n_moves[g] % 2
+
+    def do_move(self, g, move):
+        self.stones[g, move] = self.current_player(g)
+        self.last_move[g] = move
+        self.n_moves[g] += 1
+
+    def winners(self, stones):
+        """Winner of each row of stones: 1 or 2, -1 for a full board,
+        0 if the game goes on
+        """
+        on_lines = stones[:, self.lines]
+        result = np.zeros(len(stones), dtype=np.int8)
+        for player in (1, 2):
+            result[(on_lines == player).all(axis=2).any(axis=1)] = player
+        result[(result == 0) & (stones != 0).all(axis=1)] = -1
+        return result
+
+    def states(self, stones, last_move, n_moves):
+        """Network input planes for rows of stones, as Board3D.current_state
+        builds them for a single board
+        """
+        k = len(stones)
+        to_move = (1 + n_moves % 2)[:, None]
+        planes = np.zeros((k, 4, self.n_cells), dtype=np.float32)
+        planes[:, 0] = stones == to_move
+        planes[:, 1] = (stones != 0) & (stones != to_move)
+        played = last_move >= 0
+        planes[np.nonzero(played)[0], 2, last_move[played]] = 1.0
+        planes[:, 3] = (n_moves % 2 == 0)[:, None]
+        return planes.reshape(k, 4, self.depth, self.height, self.width)
+
+
+class _Slot(object):
+    """Search and game data of one active game"""
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.root = LazyTreeNode(None, 1.0)
+        self.playouts = 0
+        self.states, self.mcts_probs, self.players = [], [], []
+        self.moves, self.visits = [], []
+
+
+def _apply_virtual_loss(path):
+    for node in path:
+        node._n_visits += 1
+        node._Q += (-1.0 - node._Q) / node._n_visits
+
+
+def _revert_virtual_loss(path):
+    for node in path:
+        n = node._n_visits
+        node._Q = (node._Q * n + 1.0) / (n - 1) if n > 1 else 0.0
+        node._n_visits = n - 1
+
+
+class BatchedSelfPlay(object):
+    """Self-play of many games at once with one network batch per step.
+
+    policy_value_net: anything with policy_value(state_batch) returning
+        (move probabilities, values), e.g. PolicyValueNet3D
+    n_concurrent: games kept in flight
+    leaves_per_game: leaves collected from each tree per step
+    """
+
+    def __init__(self, policy_value_net, n_playout=400, c_puct=5, temp=1.0,
+                 n_concurrent=128, leaves_per_game=1, model_id='',
+                 width=4, height=4, depth=4, n_in_row=4):
+        self.policy_value_net = policy_value_net
+        self.n_playout = n_playout
+        self.c_puct = c_puct
+        self.temp = temp
+        self.n_concurrent = n_concurrent
+        self.leaves_per_game = leaves_per_game
+        self.model_id = model_id
+        self.board_kwargs = dict(width=width, height=height, depth=depth, n_in_row=n_in_row)
+        self.boards = BoardBatch(n_concurrent, width, height, depth, n_in_row)
+
+    def _select_leaf(self, g, slot):
+        """Descend from the root; returns (leaf, path, stones after the path)"""
+        stones = self.boards.stones[g].copy()
+        player = self.boards.current_player(g)
+        last_move = self.boards.last_move[g]
+        n_moves = self.boards.n_moves[g]
+        node = slot.root
+        path = [node]
+        while not node.is_leaf():
+            move, node = node.select(self.c_puct)
+            stones[move] = player
+            player = 3 - player
+            last_move = move
+            n_moves += 1
+            path.append(node)
+        return node, path, stones, last_move, n_moves
+
+    def _step(self, slots):
+        """Run one batch of playouts over all active games"""
+        leaves = []  # (slot, leaf, path)
+        stones, last_moves, n_moves = [], [], []
+        for g, slot in enumerate(slots):
+            if slot is None:
+                continue
+            seen = set()
+            n_leaves = min(self.leaves_per_game, self.n_playout - slot.playouts)
+            for _ in range(n_leaves):
+                leaf, path, leaf_stones, leaf_last, leaf_n = self._select_leaf(g, slot)
+                if id(leaf) in seen:
+                    break
+                seen.add(id(leaf))
+                _apply_virtual_loss(path)
+                leaves.append((slot, leaf, path))
+                stones.append(leaf_stones)
+                last_moves.append(leaf_last)
+                n_moves.append(leaf_n)
+        if not leaves:
+            return
+        stones = np.array(stones)
+        last_moves = np.array(last_moves)
+        n_moves = np.array(n_moves)
+        winners = self.boards.winners(stones)
+        open_rows = np.nonzero(winners == 0)[0]
+        if len(open_rows):
+            act_probs, values = self.policy_value_net.policy_value(
+                self.boards.states(stones[open_rows], last_moves[open_rows], n_moves[open_rows]))
+        leaf_values = np.zeros(len(leaves))
+        for i, row in enumerate(open_rows):
+            _, leaf, _ = leaves[row]
+            legal = np.nonzero(stones[row] == 0)[0]
+            leaf.expand(zip(legal.tolist(), act_probs[i][legal]))
+            leaf_values[row] = values[i][0]
+        for row in np.nonzero(winners != 0)[0]:
+            if winners[row] != -1:
+                to_move = 1 + n_moves[row] % 2
+                leaf_values[row] = 1.0 if winners[row] == to_move else -1.0
+        for (slot, leaf, path), value in zip(leaves, leaf_values):
+            _revert_virtual_loss(path)
+            leaf.update_recursive(-value)
+            slot.playouts += 1
+        METRICS.inc('mcts_playouts_total', len(leaves))
+
+    def _play_move(self, g, slot):
+        """Choose and play the move of a game whose search is complete.
+        Returns the winner if the game ended, else None.
+        """
+        boards = self.boards
+        act_visits = slot.root.child_visits()
+        acts, visits = zip(*act_visits)
+        probs = softmax(1.0/self.temp * np.log(np.array(visits) + 1e-10))
+        move_probs = np.zeros(boards.n_cells)
+        move_probs[list(acts)] = probs
+        root_visits = np.zeros(boards.n_cells)
+        root_visits[list(acts)] = visits
+        # Dirichlet noise for exploration, as MCTSPlayer does in self-play
+        move = int(np.random.choice(
+            acts, p=0.6*probs + 0.4*np.random.dirichlet(0.3*np.ones(len(probs)))))
+
+        slot.states.append(boards.states(boards.stones[g:g + 1], boards.last_move[g:g + 1],
+                                         boards.n_moves[g:g + 1])[0])
+        slot.mcts_probs.append(move_probs)
+        slot.players.append(boards.current_player(g))
+        slot.moves.append(move)
+        slot.visits.append(root_visits)
+        boards.do_move(g, move)
+
+        # reuse the subtree of the chosen move
+        child = slot.root._children.get(move)
+        slot.root = child if child is not None else LazyTreeNode(None, 1.0)
+        slot.root._parent = None
+        slot.playouts = 0
+
+        winner = int(boards.winners(boards.stones[g:g + 1])[0])
+        return winner if winner != 0 else None
+
+    def _finish(self, slot, winner):
+        players = np.array(slot.players)
+        winners_z = np.zeros(len(players))
+        if winner != -1:
+            winners_z[players == winner] = 1.0
+            winners_z[players != winner] = -1.0
+        record = GameRecord(slot.game_id, slot.moves, slot.visits, winner, self.model_id,
+                            self.temp, **self.board_kwargs)
+        return slot.game_id, winner, list(zip(slot.states, slot.mcts_probs, winners_z)), record
+
+    def play(self, n_games, first_game_id=0):
+        """Play n_games games, yielding (game_id, winner, play_data, record)
+        as each game ends. play_data holds the (state, mcts_probs, z) tuples
+        of Game3D.start_self_play.
+        """
+        queue = iter(range(first_game_id, first_game_id + n_games))
+        slots = [None] * self.n_concurrent
+
+        def refill(g):
+            game_id = next(queue, None)
+            if game_id is None:
+                slots[g] = None
+            else:
+                self.boards.reset(g)
+                slots[g] = _Slot(game_id)
+
+        for g in range(self.n_concurrent):
+            refill(g)
+        while any(slot is not None for slot in slots):
+            self._step(slots)
+            for g, slot in enumerate(slots):
+                if slot is None or slot.playouts < self.n_playout:
+                    continue
+                winner = self._play_move(g, slot)
+                if winner is not None:
+                    yield self._finish(slot, winner)
+                    refill(g)
+
+
+def run():
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+    try:
+        from .game_record import GameRecordWriter
+        from .policy_value_net_tf2_3d import PolicyValueNet3D
+    except ImportError:
+        from game_record import GameRecordWriter
+        from policy_value_net_tf2_3d import PolicyValueNet3D
+
+    parser = argparse.ArgumentParser(description='Batched 3D Gomoku self-play')
+    parser.add_argument('--games', type=int, required=True)
+    parser.add_argument('--concurrent', type=int, default=128)
+    parser.add_argument('--leaves-per-game', type=int, default=1)
+    parser.add_argument('--n-playout', type=int, default=400)
+    parser.add_argument('--c-puct', type=float, default=5)
+    parser.add_argument('--temp', type=float, default=1.0)
+    parser.add_argument('--model', default='./policy_3d_iter_100_2nd.weights.h5')
+    parser.add_argument('--output', required=True, help='game record file (.gmr)')
+    parser.add_argument('--first-game-id', type=int, default=0)
+    args = parser.parse_args()
+
+    policy = PolicyValueNet3D(4, 4, 4)
+    policy(np.zeros((1, 4, 4, 4, 4)))
+    policy.load_weights(args.model)
+
+    engine = BatchedSelfPlay(policy, n_playout=args.n_playout, c_puct=args.c_puct,
+                             temp=args.temp, n_concurrent=args.concurrent,
+                             leaves_per_game=args.leaves_per_game,
+                             model_id=os.path.basename(args.model))
+    with GameRecordWriter(args.output) as writer:
+        for game_id, winner, _, record in engine.play(args.games, args.first_game_id):
+            writer.write(record)
+            print("Game {} finished, winner: {}".format(game_id, winner))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,413 @@
+"""
+Distributed self-play.
+
+A coordinator hands out game ids to workers in leases, serves the current
+network weights and collects zlib-compressed game records into a record
+file. Workers pull the weights, play their leased games with
+Game3D.start_self_play and push the records back. A lease that is not
+completed within lease_timeout seconds goes back to the queue, and
+records are de-duplicated by game id, so workers may join, leave or die at
+any time.
+
+    python distributed_selfplay.py coordinator --games 1000 --weights model.weights.h5 --output selfplay.gmr
+    python distributed_selfplay.py worker --url http://coordinator:5050
+    python distributed_selfplay.py local --workers 4 --games 20 --output selfplay.gmr
+
+The local mode runs the coordinator and worker processes on one machine.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+
+import numpy as np
+
+try:
+    from .game_3d import Board3D, Game3D
+    from .game_record import GameRecord, GameRecordWriter
+    from .mcts_alphaZero_3d import MCTSPlayer
+except ImportError:
+    from game_3d import Board3D, Game3D
+    from game_record import GameRecord, GameRecordWriter
+    from mcts_alphaZero_3d import MCTSPlayer
+
+logger = logging.getLogger("SelfPlay")
+
+UNIFORM_MODEL_ID = 'uniform'
+
+
+def pack_records(records):
+    return zlib.compress(b''.join(record.to_bytes() for record in records))
+
+
+def unpack_records(payload):
+    data = zlib.decompress(payload)
+    records = []
+    offset = 0
+    while offset < len(data):
+        (length,) = struct.unpack_from('<I', data, offset)
+        records.append(GameRecord.from_bytes(data[offset:offset + 4 + length]))
+        offset += 4 + length
+    return records
+
+
+class SelfPlayCoordinator(object):
+    """Lease bookkeeping, weight serving and record collection"""
+
+    def __init__(self, output_path, n_games, weights_path=None, first_game_id=0,
+                 games_per_lease=2, lease_timeout=300):
+        self.weights_path = weights_path
+        self.n_games = n_games
+        self.games_per_lease = games_per_lease
+        self.lease_timeout = lease_timeout
+        self._writer = GameRecordWriter(output_path)
+        self._lock = threading.Lock()
+        self._game_ids = range(first_game_id, first_game_id + n_games)
+        self._pending = collections.deque(self._game_ids)
+        self._leases = {}  # lease id -> (worker id, game ids, deadline)
+        self._completed = set()
+        self._workers = {}  # worker id -> last seen
+        self._weights = None  # (mtime, version, bytes)
+        self.finished = threading.Event()
+
+    def model(self):
+        """Return (version, weights bytes), reloading the weights file when it changes"""
+        if self.weights_path is None:
+            return UNIFORM_MODEL_ID, b''
+        mtime = os.path.getmtime(self.weights_path)
+        if self._weights is None or self._weights[0] != mtime:
+            with open(self.weights_path, 'rb') as f:
+                data = f.read()
+            version = hashlib.sha1(data).hexdigest()[:12]
+            self._weights = (mtime, version, data)
+            logger.info(f"Serving weights version {version}")
+        return self._weights[1], self._weights[2]
+
+    def register(self, name):
+        worker_id = '{}-{}'.format(name, uuid.uuid4().hex[:8])
+        with self._lock:
+            self._workers[worker_id] = time.time()
+        logger.info(f"Worker {worker_id} registered")
+        return worker_id
+
+    def _reclaim_expired(self):
+        now = time.time()
+        for lease_id, (worker_id, game_ids, deadline) in list(self._leases.items()):
+            if deadline < now:
+                del self._leases[lease_id]
+                returned = [g for g in game_ids if g not in self._completed]
+                self._pending.extendleft(reversed(returned))
+                logger.warning(f"Lease {lease_id} of {worker_id} expired, "
+                               f"{len(returned)} games requeued")
+
+    def lease(self, worker_id):
+        with self._lock:
+            self._workers[worker_id] = time.time()
+            self._reclaim_expired()
+            if len(self._completed) >= self.n_games:
+                return {'done': True}
+            game_ids = []
+            while self._pending and len(game_ids) < self.games_per_lease:
+                game_id = self._pending.popleft()
+                if game_id not in self._completed:
+                    game_ids.append(game_id)
+            if not game_ids:
+                # everything is leased out; ask the worker to come back later
+                return {'gameIds': [], 'retryAfter': 1.0}
+            lease_id = uuid.uuid4().hex
+            self._leases[lease_id] = (worker_id, game_ids, time.time() + self.lease_timeout)
+        return {'leaseId': lease_id, 'gameIds': game_ids, 'modelVersion': self.model()[0],
+                'leaseTimeout': self.lease_timeout}
+
+    def heartbeat(self, lease_id):
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is None:
+                return False
+            self._leases[lease_id] = (lease[0], lease[1], time.time() + self.lease_timeout)
+            self._workers[lease[0]] = time.time()
+            return True
+
+    def submit(self, lease_id, payload):
+        """Store the records of a finished lease, dropping games already
+        completed. Returns the number of records accepted.
+        """
+        records = unpack_records(payload)
+        accepted = 0
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            for record in records:
+                if record.game_id in self._completed or record.game_id not in self._game_ids:
+                    continue
+                self._writer.write(record)
+                self._completed.add(record.game_id)
+                accepted += 1
+            self._writer.flush()
+            if lease is not None:
+                # games of the lease that were not returned go back to the queue
+                missing = [g for g in lease[1] if g not in self._completed]
+                self._pending.extendleft(reversed(missing))
+            done = len(self._completed)
+        logger.info(f"Lease {lease_id}: accepted {accepted}/{len(records)} games "
+                    f"({done}/{self.n_games} done)")
+        if done >= self.n_games:
+            self.finished.set()
+        return accepted
+
+    def status(self):
+        with self._lock:
+            return {'completed': len(self._completed), 'total': self.n_games,
+                    'pending': len(self._pending), 'leases': len(self._leases),
+                    'workers': len(self._workers)}
+
+    def close(self):
+        self._writer.close()
+
+    def make_app(self):
+        from flask import Flask, Response, jsonify, request
+
+        app = Flask(__name__)
+
+        @app.route('/register', methods=['POST'])
+        def register():
+            return jsonify({'workerId': self.register(request.json.get('name', 'worker'))})
+
+        @app.route('/lease', methods=['POST'])
+        def lease():
+            return jsonify(self.lease(request.json['workerId']))
+
+        @app.route('/heartbeat', methods=['POST'])
+        def heartbeat():
+            return jsonify({'ok': self.heartbeat(request.json['leaseId'])})
+
+        @app.route('/submit/<lease_id>', methods=['POST'])
+        def submit(lease_id):
+            return jsonify({'accepted': self.submit(lease_id, request.get_data())})
+
+        @app.route('/weights', methods=['GET'])
+        def weights():
+            version, data = self.model()
+            return Response(data, mimetype='application/octet-stream',
+                            headers={'X-Model-Version': version})
+
+        @app.route('/status', methods=['GET'])
+        def status():
+            return jsonify(self.status())
+
+        return app
+
+
+def serve(coordinator, host='0.0.0.0', port=5050):
+    """Serve the coordinator in a background thread; returns the server"""
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, coordinator.make_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Coordinator listening on {host}:{server.server_port}")
+    return server
+
+
+class SelfPlayWorker(object):
+    """Pull leases from a coordinator, play them and push the records"""
+
+    def __init__(self, url, n_playout=400, c_puct=5, temp=1.0, size=4, n_in_row=4,
+                 seed=None, retries=10):
+        self.url = url.rstrip('/')
+        self.n_playout = n_playout
+        self.c_puct = c_puct
+        self.temp = temp
+        self.size = size
+        self.n_in_row = n_in_row
+        self.retries = retries
+        self._net = None
+        self._policy = None
+        self._model_version = None
+        if seed is not None:
+            np.random.seed(seed)
+
+    def _request(self, path, payload=None, data=None):
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers = {'Content-Type': 'application/json'}
+        else:
+            headers = {'Content-Type': 'application/octet-stream'}
+        delay = 1.0
+        for attempt in range(self.retries):
+            try:
+                req = urllib.request.Request(self.url + path, data=data, headers=headers)
+                with urllib.request.urlopen(req, timeout=60) as response:
+                    body = response.read()
+                    if response.headers.get('Content-Type', '').startswith('application/json'):
+                        return json.loads(body)
+                    return body, response.headers.get('X-Model-Version')
+            except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                if attempt == self.retries - 1:
+                    raise
+                logger.warning(f"Coordinator unreachable ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _uniform_policy(self, board):
+        action_probs = np.ones(len(board.availables)) / len(board.availables)
+        return zip(board.availables, action_probs), 0.0
+
+    def _load_model(self, version):
+        if version == self._model_version:
+            return
+        if version == UNIFORM_MODEL_ID:
+            self._policy = self._uniform_policy
+        else:
+            try:
+                from .policy_value_net_tf2_3d import PolicyValueNet3D
+            except ImportError:
+                from policy_value_net_tf2_3d import PolicyValueNet3D
+            data, version = self._request('/weights')
+            if self._net is None:
+                self._net = PolicyValueNet3D(self.size, self.size, self.size)
+                self._net(np.zeros((1, 4, self.size, self.size, self.size)))
+            with tempfile.NamedTemporaryFile(suffix='.weights.h5', delete=False) as f:
+                f.write(data)
+            try:
+                self._net.load_weights(f.name)
+            finally:
+                os.remove(f.name)
+            self._policy = self._net.policy_value_fn
+        self._model_version = version
+        logger.info(f"Loaded model version {version}")
+
+    def run(self):
+        worker_id = self._request('/register', {'name': socket.gethostname()})['workerId']
+        board = Board3D(width=self.size, height=self.size, depth=self.size, n_in_row=self.n_in_row)
+        game = Game3D(board)
+        n_played = 0
+        while True:
+            try:
+                lease = self._request('/lease', {'workerId': worker_id})
+                if lease.get('done'):
+                    break
+                if not lease['gameIds']:
+                    time.sleep(lease.get('retryAfter', 1.0))
+                    continue
+                self._load_model(lease['modelVersion'])
+                player = MCTSPlayer(self._policy, c_puct=self.c_puct,
+                                    n_playout=self.n_playout, is_selfplay=1)
+                records = []
+                for game_id in lease['gameIds']:
+                    _, _, record = game.start_self_play(player, temp=self.temp, return_record=1,
+                                                        game_id=game_id,
+                                                        model_id=self._model_version)
+                    records.append(record)
+                    self._request('/heartbeat', {'leaseId': lease['leaseId']})
+                self._request('/submit/' + lease['leaseId'], data=pack_records(records))
+                n_played += len(records)
+            except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                logger.warning(f"Lost the coordinator ({e}), stopping")
+                break
+        logger.info(f"Worker {worker_id} finished after {n_played} games")
+        return n_played
+
+
+def _worker_process(url, kwargs):
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    SelfPlayWorker(url, **kwargs).run()
+
+
+def run_local(output_path, n_games, n_workers=2, weights_path=None, port=0, **worker_kwargs):
+    """Run a coordinator and n_workers worker processes on this machine and
+    block until all games are recorded
+    """
+    coordinator = SelfPlayCoordinator(output_path, n_games, weights_path)
+    server = serve(coordinator, '127.0.0.1', port)
+    url = 'http://127.0.0.1:{}'.format(server.server_port)
+    ctx = multiprocessing.get_context('spawn')
+    workers = []
+    try:
+        for i in range(n_workers):
+            kwargs = dict(worker_kwargs, seed=i)
+            proc = ctx.Process(target=_worker_process, args=(url, kwargs), daemon=True)
+            proc.start()
+            workers.append(proc)
+        while not coordinator.finished.wait(timeout=1.0):
+            if not any(proc.is_alive() for proc in workers):
+                raise RuntimeError("all self-play workers exited before finishing")
+        for proc in workers:
+            proc.join(timeout=30)
+    finally:
+        for proc in workers:
+            if proc.is_alive():
+                proc.terminate()
+        server.shutdown()
+        coordinator.close()
+    return coordinator.status()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Distributed 3D Gomoku self-play')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_game_args(p):
+        p.add_argument('--n-playout', type=int, default=400)
+        p.add_argument('--c-puct', type=float, default=5)
+        p.add_argument('--temp', type=float, default=1.0)
+
+    coord = sub.add_parser('coordinator')
+    coord.add_argument('--games', type=int, required=True)
+    coord.add_argument('--output', required=True, help='game record file (.gmr)')
+    coord.add_argument('--weights', help='weights file served to workers; uniform policy if omitted')
+    coord.add_argument('--first-game-id', type=int, default=0)
+    coord.add_argument('--games-per-lease', type=int, default=2)
+    coord.add_argument('--lease-timeout', type=float, default=300)
+    coord.add_argument('--host', default='0.0.0.0')
+    coord.add_argument('--port', type=int, default=5050)
+
+    worker = sub.add_parser('worker')
+    worker.add_argument('--url', required=True)
+    add_game_args(worker)
+
+    local = sub.add_parser('local')
+    local.add_argument('--games', type=int, required=True)
+    local.add_argument('--workers', type=int, default=2)
+    local.add_argument('--output', required=True)
+    local.add_argument('--weights')
+    add_game_args(local)
+
+    args = parser.parse_args()
+    if args.command == 'coordinator':
+        coordinator = SelfPlayCoordinator(args.output, args.games, args.weights,
+                                          args.first_game_id, args.games_per_lease,
+                                          args.lease_timeout)
+        server = serve(coordinator, args.host, args.port)
+        try:
+            coordinator.finished.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            coordinator.close()
+        print(coordinator.status())
+    elif args.command == 'worker':
+        SelfPlayWorker(args.url, n_playout=args.n_playout, c_puct=args.c_puct,
+                       temp=args.temp).run()
+    else:
+        print(run_local(args.output, args.games, args.workers, args.weights,
+                        n_playout=args.n_playout, c_puct=args.c_puct, temp=args.temp))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,26 @@
 from __future__ import print_function
 import numpy as np
 
+DIRECTIONS = [(0, 0, 1), (0, 1, 0), (1, 0, 0),
+              (0, 1, 1), (0, 1, -1), (1, 0, 1), (1, 0, -1), (1, 1, 0), (1, -1, 0),
+              (1, 1, 1), (1, 1, -1), (1, -1, 1), (1, -1, -1)]
+
+
+def winning_lines(width, height, depth, n_in_row):
+    """Array (n_lines, n_in_row) of the move indices of every winning line"""
+    lines = []
+    for d in range(depth):
+        for h in range(height):
+            for w in range(width):
+                for dd, dh, dw in DIRECTIONS:
+                    end = (d + dd * (n_in_row - 1), h + dh * (n_in_row - 1),
+                           w + dw * (n_in_row - 1))
+                    if 0 <= end[0] < depth and 0 <= end[1] < height and 0 <= end[2] < width:
+                        lines.append([(d + dd * i) * width * height + (h + dh * i) * width
+                                      + (w + dw * i) for i in range(n_in_row)])
+    return np.array(lines, dtype=np.intp)
+
+
 class Board3D(object):
     """3D board for the game"""
 
@@ -66,6 +86,29 @@ class Board3D(object):
         self.current_player = self.players[0] if self.current_player == self.players[1] else self.players[1]
         self.last_move = move
 
+    def load_moves(self, moves):
+        """Place an ordered list of moves on a freshly initialised board in
+        one pass, alternating players from the current one. Raises
+        ValueError on the first out-of-range or repeated move.
+        """
+        n_cells = self.width * self.height * self.depth
+        placed = set(self.states)
+        players = (self.current_player,
+                   self.players[0] if self.current_player == self.players[1] else self.players[1])
+        for i, move in enumerate(moves):
+            if not isinstance(move, (int, np.integer)) or isinstance(move, bool):
+                raise ValueError("Invalid move {!r} at index {}: not an integer".format(move, i))
+            if not 0 <= move < n_cells:
+                raise ValueError("Invalid move {} at index {}: off the board".format(move, i))
+            if move in placed:
+                raise ValueError("Invalid move {} at index {}: position already taken".format(move, i))
+            placed.add(move)
+            self.states[int(move)] = players[i % 2]
+        if moves:
+            self.availables = [m for m in self.availables if m not in placed]
+            self.current_player = players[len(moves) % 2]
+            self.last_move = int(moves[-1])
+
     def has_a_winner(self):
         width = self.width
         height = self.height
@@ -82,19 +125,7 @@ class Board3D(object):
             player = states[m]
 
             # Check all 13 possible directions in 3D space
-            directions = [
-                # Straight lines along each axis
-                [(0,0,1)], [(0,1,0)], [(1,0,0)],
-                # Diagonal in each face
-                [(0,1,1)], [(0,1,-1)],  # xy-plane
-                [(1,0,1)], [(1,0,-1)],  # xz-plane
-                [(1,1,0)], [(1,-1,0)],  # yz-plane
-                # Main space diagonals
-                [(1,1,1)], [(1,1,-1)], [(1,-1,1)], [(1,-1,-1)]
-            ]
-
-            for direction in directions:
-                dx, dy, dz = direction[0]
+            for dz, dy, dx in DIRECTIONS:
                 count = 0
                 x, y, z = w, h, d
                 
@@ -130,11 +161,116 @@ class Board3D(object):
         return self.current_player
 
 
+class Adjudicator(object):
+    """Ends games early by resignation or agreed draw.
+
+    A player resigns once its value (the root Q of its search and, when
+    value_fn is given, the value estimate of the position) has stayed
+    below resign_threshold for resign_consecutive of its own moves. A game
+    is adjudicated a draw once every value has been within draw_threshold
+    of 0 for draw_consecutive moves in a row. check_fraction of the games
+    that would be ended are played out instead, to count how often the
+    decision was wrong.
+    """
+
+    def __init__(self, **kwargs):
+        self.resign_threshold = kwargs.get('resign_threshold')  # e.g. -0.95, None disables
+        self.resign_consecutive = int(kwargs.get('resign_consecutive', 3))
+        self.resign_min_moves = int(kwargs.get('resign_min_moves', 8))
+        self.draw_threshold = kwargs.get('draw_threshold')  # e.g. 0.05, None disables
+        self.draw_consecutive = int(kwargs.get('draw_consecutive', 8))
+        self.draw_min_moves = int(kwargs.get('draw_min_moves', 32))
+        self.check_fraction = float(kwargs.get('resign_check_fraction', 0.1))
+        self.value_fn = kwargs.get('value_fn')
+        self.stats = dict.fromkeys(('games', 'resigned', 'resign_checked', 'false_resignations',
+                                    'drawn', 'draw_checked', 'false_draws'), 0)
+
+    @property
+    def enabled(self):
+        return self.resign_threshold is not None or self.draw_threshold is not None
+
+    def new_game(self):
+        self._low_moves = {}
+        self._quiet_moves = 0
+        self._checking = None  # (kind, resigning player) of a game being played out
+
+    def position_values(self, board, player):
+        """Values of the position for the side to move, or [] for a player
+        without a search tree (e.g. a human)
+        """
+        root_q = getattr(getattr(player, 'mcts', None), 'last_value', None)
+        if root_q is None:
+            return []
+        values = [root_q]
+        if self.value_fn is not None:
+            values.append(float(self.value_fn(board)))
+        return values
+
+    def observe(self, board, values):
+        """Record the values of the side to move before its move. Returns
+        the adjudicated winner (-1 for a draw), or None to play on.
+        """
+        if not values or self._checking is not None:
+            return None
+        player = board.get_current_player()
+        n_moves = len(board.states)
+        decision = None
+        if self.resign_threshold is not None:
+            low = self._low_moves.get(player, 0) + 1 if max(values) < self.resign_threshold else 0
+            self._low_moves[player] = low
+            if low >= self.resign_consecutive and n_moves >= self.resign_min_moves:
+                decision = ('resign', player)
+        if decision is None and self.draw_threshold is not None:
+            quiet = max(abs(v) for v in values) < self.draw_threshold
+            self._quiet_moves = self._quiet_moves + 1 if quiet else 0
+            if self._quiet_moves >= self.draw_consecutive and n_moves >= self.draw_min_moves:
+                decision = ('draw', None)
+        if decision is None:
+            return None
+        if np.random.random() < self.check_fraction:
+            self._checking = decision
+            return None
+        if decision[0] == 'resign':
+            self.stats['resigned'] += 1
+            return board.players[0] if player == board.players[1] else board.players[1]
+        self.stats['drawn'] += 1
+        return -1
+
+    def finish(self, winner):
+        """Score a played-out check against the real result"""
+        self.stats['games'] += 1
+        if self._checking is None:
+            return
+        kind, player = self._checking
+        if kind == 'resign':
+            self.stats['resign_checked'] += 1
+            # the resigning player would not have lost
+            if winner == player or winner == -1:
+                self.stats['false_resignations'] += 1
+        else:
+            self.stats['draw_checked'] += 1
+            if winner != -1:
+                self.stats['false_draws'] += 1
+
+    def false_resignation_rate(self):
+        """Share of played-out resignations the resigning player did not lose"""
+        if not self.stats['resign_checked']:
+            return None
+        return self.stats['false_resignations'] / float(self.stats['resign_checked'])
+
+
 class Game3D(object):
-    """3D game server"""
+    """3D game server
+
+    Adjudication settings (resign_threshold, resign_consecutive,
+    resign_min_moves, resign_check_fraction, draw_threshold,
+    draw_consecutive, draw_min_moves, value_fn) are passed as kwargs, see
+    Adjudicator. Resignation and draws are off by default.
+    """
 
     def __init__(self, board, **kwargs):
         self.board = board
+        self.adjudicator = Adjudicator(**kwargs)
 
     def graphic(self, board, player1, player2):
         """Draw the board and show game info"""
@@ -174,15 +310,25 @@ class Game3D(object):
         players = {p1: player1, p2: player2}
         if is_shown:
             self.graphic(self.board, player1.player, player2.player)
+        adjudicator = self.adjudicator
+        adjudicator.new_game()
         while True:
             current_player = self.board.get_current_player()
             player_in_turn = players[current_player]
             move = player_in_turn.get_action(self.board)
-            self.board.do_move(move)
-            if is_shown:
-                self.graphic(self.board, player1.player, player2.player)
-            end, winner = self.board.game_end()
+            end, winner = False, -1
+            if adjudicator.enabled:
+                adjudicated = adjudicator.observe(
+                    self.board, adjudicator.position_values(self.board, player_in_turn))
+                if adjudicated is not None:
+                    end, winner = True, adjudicated
+            if not end:
+                self.board.do_move(move)
+                if is_shown:
+                    self.graphic(self.board, player1.player, player2.player)
+                end, winner = self.board.game_end()
             if end:
+                adjudicator.finish(winner)
                 if is_shown:
                     if winner != -1:
                         print("Game end. Winner is", players[winner])
@@ -190,37 +336,75 @@ class Game3D(object):
                         print("Game end. Tie")
                 return winner
 
-    def start_self_play(self, player, is_shown=0, temp=1e-3):
+    def start_self_play(self, player, is_shown=0, temp=1e-3, return_record=0,
+                        game_id=0, model_id=''):
         """ start a self-play game using a MCTS player, reuse the search tree,
-        and store the self-play data: (state, mcts_probs, z) for training
+        and store the self-play data: (state, mcts_probs, z) for training.
+        With return_record, also return a GameRecord of the moves and root
+        visit counts, from which the same data can be regenerated.
         """
         self.board.init_board()
         p1, p2 = self.board.players
         states, mcts_probs, current_players = [], [], []
+        moves, visits = [], []
+        n_cells = self.board.width * self.board.height * self.board.depth
+        adjudicator = self.adjudicator
+        adjudicator.new_game()
         while True:
             move, move_probs = player.get_action(self.board,
                                                  temp=temp,
                                                  return_prob=1)
+            if adjudicator.enabled:
+                adjudicated = adjudicator.observe(
+                    self.board, adjudicator.position_values(self.board, player))
+                if adjudicated is not None:
+                    # the game ends before this move; earlier positions take
+                    # their targets from the adjudicated result
+                    return self._end_self_play(player, adjudicated, states, mcts_probs,
+                                               current_players, is_shown, return_record,
+                                               moves, visits, game_id, model_id, temp)
             # store the data FOR EACH MOVE
             states.append(self.board.current_state())
             mcts_probs.append(move_probs)
             current_players.append(self.board.current_player)
+            if return_record:
+                root_visits = np.zeros(n_cells)
+                for act, n in player.mcts.last_visits.items():
+                    root_visits[act] = n
+                moves.append(move)
+                visits.append(root_visits)
             # perform a move
             self.board.do_move(move)
             if is_shown:
                 self.graphic(self.board, p1, p2)
             end, winner = self.board.game_end()
             if end:
-                # winner from the perspective of the current player of each state
-                winners_z = np.zeros(len(current_players))
-                if winner != -1:
-                    winners_z[np.array(current_players) == winner] = 1.0
-                    winners_z[np.array(current_players) != winner] = -1.0
-                # reset MCTS root node
-                player.reset_player()
-                if is_shown:
-                    if winner != -1:
-                        print("Game end. Winner is player:", winner)
-                    else:
-                        print("Game end. Tie")
-                return winner, zip(states, mcts_probs, winners_z)
\ No newline at end of file
+                return self._end_self_play(player, winner, states, mcts_probs,
+                                           current_players, is_shown, return_record,
+                                           moves, visits, game_id, model_id, temp)
+
+    def _end_self_play(self, player, winner, states, mcts_probs, current_players, is_shown,
+                       return_record, moves, visits, game_id, model_id, temp):
+        self.adjudicator.finish(winner)
+        # winner from the perspective of the current player of each state
+        winners_z = np.zeros(len(current_players))
+        if winner != -1:
+            winners_z[np.array(current_players) == winner] = 1.0
+            winners_z[np.array(current_players) != winner] = -1.0
+        # reset MCTS root node
+        player.reset_player()
+        if is_shown:
+            if winner != -1:
+                print("Game end. Winner is player:", winner)
+            else:
+                print("Game end. Tie")
+        if return_record:
+            try:
+                from .game_record import GameRecord
+            except ImportError:
+                from game_record import GameRecord
+            record = GameRecord(game_id, moves, visits, winner, model_id, temp,
+                                self.board.width, self.board.height,
+                                self.board.depth, self.board.n_in_row)
+            return winner, zip(states, mcts_probs, winners_z), record
+        return winner, zip(states, mcts_probs, winners_z)
@@ -0,0 +1,233 @@
+"""
+Compact binary records of self-play games.
+
+A record file (.gmr) holds one record per game: the move sequence, the root
+visit counts of every move (uint16, stored only for the cells that were
+empty at that move), the winner, the model id and the search temperature.
+An index file (.gmi) next to it maps game ids to record offsets for random
+access. Training tuples (state, mcts_probs, z) are regenerated on demand by
+replaying the moves, which is far smaller than storing the state planes.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+try:
+    from .game_3d import Board3D
+    from .mcts_alphaZero_3d import softmax
+except ImportError:
+    from game_3d import Board3D
+    from mcts_alphaZero_3d import softmax
+
+RECORD_MAGIC = b'GMR1'
+INDEX_MAGIC = b'GMI1'
+# record length, game id, winner, width, height, depth, n_in_row,
+# start player, model id length, number of moves, temperature
+RECORD_HEADER = struct.Struct('<IQbBBBBBBHf')
+INDEX_ENTRY = struct.Struct('<QQ')  # game id, record offset
+
+
+class GameRecord(object):
+    """One self-play game.
+
+    moves: move indices in play order
+    visits: array (n_moves, n_cells) of root visit counts before each move
+    winner: winning player (1 or 2), or -1 for a tie
+
+    Moves and board dimensions are stored as single bytes, so boards are
+    limited to 256 cells.
+    """
+
+    def __init__(self, game_id, moves, visits, winner, model_id='', temp=1e-3,
+                 width=4, height=4, depth=4, n_in_row=4, start_player=0):
+        if width * height * depth > 256 or max(width, height, depth, n_in_row) > 255:
+            raise ValueError("game records support boards of at most 256 cells, "
+                             "got {}x{}x{}".format(width, height, depth))
+        self.game_id = int(game_id)
+        self.moves = np.asarray(moves, dtype=np.uint8)
+        self.visits = np.minimum(np.asarray(visits), np.iinfo(np.uint16).max).astype(np.uint16)
+        self.winner = int(winner)
+        self.model_id = model_id
+        self.temp = float(temp)
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.n_in_row = n_in_row
+        self.start_player = start_player
+
+    @property
+    def n_cells(self):
+        return self.width * self.height * self.depth
+
+    def to_bytes(self):
+        model_id = self.model_id.encode('utf-8')
+        if len(model_id) > 255:
+            raise ValueError("model id is longer than 255 bytes")
+        # visits of the cells still empty at each move, in cell order
+        empty = np.ones(self.n_cells, dtype=bool)
+        legal_visits = []
+        for move, visits in zip(self.moves, self.visits):
+            legal_visits.append(visits[empty])
+            empty[move] = False
+        body = (model_id + self.moves.tobytes()
+                + np.concatenate(legal_visits or [np.zeros(0, np.uint16)]).astype('<u2').tobytes())
+        header = RECORD_HEADER.pack(RECORD_HEADER.size - 4 + len(body), self.game_id,
+                                    self.winner, self.width, self.height, self.depth,
+                                    self.n_in_row, self.start_player, len(model_id),
+                                    len(self.moves), self.temp)
+        return header + body
+
+    @classmethod
+    def from_bytes(cls, data):
+        (_, game_id, winner, width, height, depth, n_in_row, start_player,
+         model_id_len, n_moves, temp) = RECORD_HEADER.unpack_from(data)
+        pos = RECORD_HEADER.size
+        model_id = bytes(data[pos:pos + model_id_len]).decode('utf-8')
+        pos += model_id_len
+        moves = np.frombuffer(data, dtype=np.uint8, count=n_moves, offset=pos)
+        pos += n_moves
+        n_cells = width * height * depth
+        n_legal = n_cells - np.arange(n_moves)
+        legal_visits = np.frombuffer(data, dtype='<u2', count=int(n_legal.sum()), offset=pos)
+        visits = np.zeros((n_moves, n_cells), dtype=np.uint16)
+        empty = np.ones(n_cells, dtype=bool)
+        start = 0
+        for i, move in enumerate(moves):
+            visits[i, empty] = legal_visits[start:start + n_legal[i]]
+            start += n_legal[i]
+            empty[move] = False
+        return cls(game_id, moves.copy(), visits, winner, model_id, temp,
+                   width, height, depth, n_in_row, start_player)
+
+
+def index_path(path):
+    return os.path.splitext(path)[0] + '.gmi'
+
+
+class GameRecordWriter(object):
+    """Append game records to a record file and its index"""
+
+    def __init__(self, path):
+        self.path = path
+        self._data = open(path, 'ab')
+        self._index = open(index_path(path), 'ab')
+        if self._data.tell() == 0:
+            self._data.write(RECORD_MAGIC)
+            self._index.truncate(0)
+        if self._index.tell() == 0:
+            self._index.write(INDEX_MAGIC)
+
+    def write(self, record):
+        offset = self._data.tell()
+        self._data.write(record.to_bytes())
+        self._index.write(INDEX_ENTRY.pack(record.game_id, offset))
+
+    def flush(self):
+        self._data.flush()
+        self._index.flush()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class GameRecordReader(object):
+    """Read game records sequentially, or by game id through the index"""
+
+    def __init__(self, path):
+        self.path = path
+        self._data = open(path, 'rb')
+        if self._data.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError("{} is not a game record file".format(path))
+        self._offsets = None
+
+    def _load_index(self):
+        with open(index_path(self.path), 'rb') as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError("bad game record index for {}".format(self.path))
+            entries = np.frombuffer(f.read(), dtype=[('game_id', '<u8'), ('offset', '<u8')])
+        # the last entry wins if a game id was written twice
+        self._offsets = dict(zip(entries['game_id'].tolist(), entries['offset'].tolist()))
+
+    def _read_at(self, offset):
+        """Return the record at offset and the offset of the next one"""
+        self._data.seek(offset)
+        head = self._data.read(4)
+        if len(head) < 4:
+            return None, offset
+        (length,) = struct.unpack('<I', head)
+        return GameRecord.from_bytes(head + self._data.read(length)), offset + 4 + length
+
+    def __iter__(self):
+        """Stream every record in file order, one at a time"""
+        offset = len(RECORD_MAGIC)
+        while True:
+            record, offset = self._read_at(offset)
+            if record is None:
+                return
+            yield record
+
+    def game_ids(self):
+        if self._offsets is None:
+            self._load_index()
+        return list(self._offsets)
+
+    def get(self, game_id):
+        if self._offsets is None:
+            self._load_index()
+        return self._read_at(self._offsets[int(game_id)])[0]
+
+    def __len__(self):
+        if self._offsets is None:
+            self._load_index()
+        return len(self._offsets)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def record_to_training_data(record, temp=None):
+    """Replay a record into the (state, mcts_probs, z) tuples that
+    Game3D.start_self_play produces. temp defaults to the temperature the
+    game was played with.
+    """
+    temp = record.temp if temp is None else temp
+    board = Board3D(width=record.width, height=record.height, depth=record.depth,
+                    n_in_row=record.n_in_row)
+    board.init_board(record.start_player)
+    data = []
+    for move, visits in zip(record.moves, record.visits):
+        acts = np.nonzero(visits)[0]
+        mcts_probs = np.zeros(record.n_cells)
+        mcts_probs[acts] = softmax(1.0/temp * np.log(visits[acts] + 1e-10))
+        player = board.current_player
+        if record.winner == -1:
+            z = 0.0
+        else:
+            z = 1.0 if player == record.winner else -1.0
+        data.append((board.current_state(), mcts_probs, z))
+        board.do_move(int(move))
+    return data
+
+
+def iter_training_data(records, temp=None):
+    """Stream training tuples from an iterable of records"""
+    for record in records:
+        for sample in record_to_training_data(record, temp):
+            yield sample
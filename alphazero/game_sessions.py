@@ -0,0 +1,84 @@
+"""
+Server-side game sessions for the compact move protocol.
+
+A session keeps the ordered move list of one game so that clients only need
+to send the latest move and the game id. Sessions expire after ttl seconds
+without activity.
+"""
+
+import threading
+import time
+import uuid
+
+
+class GameSessionError(LookupError):
+    """The request refers to an unknown, expired or out-of-sync session;
+    the client should resend the full move list
+    """
+
+
+class GameSession(object):
+    def __init__(self, game_id, moves=None):
+        self.game_id = game_id
+        self.moves = list(moves or [])
+        self.lock = threading.Lock()
+        # per-game search state, set by the server when pondering is enabled
+        self.player = None
+        self.ponderer = None
+        self.touch()
+
+    def touch(self):
+        self.last_used = time.time()
+
+    def close(self):
+        if self.ponderer is not None:
+            self.ponderer.stop(wait=False)
+
+
+class GameSessionStore(object):
+    """Thread-safe map from game id to GameSession with idle expiry"""
+
+    def __init__(self, ttl=1800, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, moves=None, game_id=None):
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                # drop the least recently used session to make room
+                oldest = min(self._sessions.values(), key=lambda s: s.last_used)
+                self._remove(oldest.game_id)
+            game_id = game_id or uuid.uuid4().hex
+            session = GameSession(game_id, moves)
+            self._sessions[game_id] = session
+            return session
+
+    def get(self, game_id):
+        """Return the live session for game_id, or None"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(game_id)
+            if session is not None:
+                session.touch()
+            return session
+
+    def discard(self, game_id):
+        with self._lock:
+            self._remove(game_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _remove(self, game_id):
+        session = self._sessions.pop(game_id, None)
+        if session is not None:
+            session.close()
+
+    def _expire(self):
+        deadline = time.time() - self.ttl
+        for game_id in [g for g, s in self._sessions.items() if s.last_used < deadline]:
+            self._remove(game_id)
+
@@ -2,6 +2,7 @@ from game_3d import Board3D, Game3D
 from mcts_pure import MCTSPlayer as MCTS_Pure
 from mcts_alphaZero_3d import MCTSPlayer  # Changed to use 3D version
 from policy_value_net_tf2_3d import PolicyValueNet3D
+from runtime_config import configure_runtime, describe_runtime
 
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
@@ -15,6 +16,9 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 tf.get_logger().setLevel(logging.ERROR)
 tf.keras.utils.disable_interactive_logging()
 
+# thread pools and CPU pinning from the GOMOKU_TF_* / GOMOKU_CPU_AFFINITY settings
+print(describe_runtime(configure_runtime()))
+
 class Human:
     def __init__(self):
         self.player = None
@@ -0,0 +1,71 @@
+"""
+The PolicyValueNet3D predict workload shared by the inference benchmark
+(benchmarks/bench_inference.py) and the thread tuner (runtime_config.py):
+fixed random input batches, a network with fixed initial weights, and
+latency percentiles of predict per batch size.
+"""
+
+import os
+import time
+
+import numpy as np
+
+GRID_SIZE = 4
+SEED = 1234
+BATCH_SIZES = (1, 8, 32, 128, 512)
+WARMUP = 3
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'policy_3d_iter_100_2nd.weights.h5')
+
+
+def load_network(model_path=MODEL_PATH, seed=SEED):
+    """Build PolicyValueNet3D with fixed initial weights, loading the trained
+    weights when they are present
+    """
+    import tensorflow as tf
+    try:
+        from .policy_value_net_tf2_3d import PolicyValueNet3D
+    except ImportError:
+        from policy_value_net_tf2_3d import PolicyValueNet3D
+
+    tf.get_logger().setLevel('ERROR')
+    tf.random.set_seed(seed)
+    net = PolicyValueNet3D(GRID_SIZE, GRID_SIZE, GRID_SIZE)
+    if model_path and os.path.exists(model_path):
+        net.load_weights(model_path)
+    return net
+
+
+def workload_states(batch_sizes=BATCH_SIZES, seed=SEED):
+    """Fixed random input batches, as (batch size, states) pairs"""
+    rng = np.random.RandomState(seed)
+    batches = []
+    for batch_size in batch_sizes:
+        states = rng.randint(0, 2, size=(batch_size, 4, GRID_SIZE, GRID_SIZE, GRID_SIZE))
+        batches.append((batch_size, states.astype(np.float32)))
+    return batches
+
+
+def time_calls(fn, repeat, warmup=WARMUP):
+    """Per-call seconds of repeat calls of fn() after warmup untimed calls"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def time_predict(net, states, repeat):
+    return time_calls(lambda: net.predict(states), repeat)
+
+
+def latency_stats(times, batch_size):
+    times = np.asarray(times)
+    return {
+        'p50_ms': float(np.percentile(times, 50)) * 1e3,
+        'p95_ms': float(np.percentile(times, 95)) * 1e3,
+        'throughput': batch_size / float(np.percentile(times, 50)),
+    }
@@ -1,6 +1,14 @@
 import numpy as np
 import copy
 import logging
+import math
+
+try:
+    from .metrics import METRICS, perf_counter
+    from .node_pool import PROCESS_BUDGET, NodePool
+except ImportError:
+    from metrics import METRICS, perf_counter
+    from node_pool import PROCESS_BUDGET, NodePool
 
 def softmax(x):
     probs = np.exp(x - np.max(x))
@@ -8,6 +16,8 @@ def softmax(x):
     return probs
 
 class TreeNode(object):
+    __slots__ = ('_parent', '_children', '_n_visits', '_Q', '_u', '_P')
+
     def __init__(self, parent, prior_p):
         self._parent = parent
         self._children = {}  # a map from action to TreeNode
@@ -16,10 +26,24 @@ class TreeNode(object):
         self._u = 0
         self._P = prior_p
 
-    def expand(self, action_priors):
-        for action, prob in action_priors:
-            if action not in self._children:
-                self._children[action] = TreeNode(self, prob)
+    def reset(self, parent, prior_p):
+        """Reinitialise a recycled node, keeping its (empty) children dict"""
+        self._parent = parent
+        self._n_visits = 0
+        self._Q = 0
+        self._u = 0
+        self._P = prior_p
+
+    def expand(self, action_priors, pool=None):
+        if pool is not None:
+            n_new = pool.expand(self, action_priors)
+        else:
+            n_before = len(self._children)
+            for action, prob in action_priors:
+                if action not in self._children:
+                    self._children[action] = TreeNode(self, prob)
+            n_new = len(self._children) - n_before
+        METRICS.inc('mcts_nodes_allocated_total', n_new)
 
     def select(self, c_puct):
         return max(self._children.items(),
@@ -45,60 +69,251 @@ class TreeNode(object):
     def is_root(self):
         return self._parent is None
 
+    def child_visits(self):
+        return [(act, node._n_visits) for act, node in self._children.items()]
+
+class LazyTreeNode(object):
+    """Tree node that stores the priors of its moves as plain lists and
+    only creates a child node when that move is first selected. Statistics
+    are kept as Python floats.
+    """
+    __slots__ = ('_parent', '_children', '_n_visits', '_Q', '_P', '_actions', '_priors')
+
+    def __init__(self, parent, prior_p):
+        self._parent = parent
+        self._children = {}  # a map from action to LazyTreeNode, selected moves only
+        self._n_visits = 0
+        self._Q = 0.0
+        self._P = prior_p
+        self._actions = None  # legal moves once expanded
+        self._priors = None
+
+    def expand(self, action_priors, pool=None):
+        actions, priors = [], []
+        for action, prob in action_priors:
+            actions.append(action)
+            priors.append(float(prob))
+        self._actions = actions
+        self._priors = priors
+
+    def select(self, c_puct):
+        # the exploration factor of the parent is computed once per selection
+        sqrt_n = math.sqrt(self._n_visits)
+        children = self._children
+        best_value = -math.inf
+        best_action = best_prior = None
+        for action, prior in zip(self._actions, self._priors):
+            child = children.get(action)
+            if child is None:
+                value = c_puct * prior * sqrt_n
+            else:
+                value = child._Q + c_puct * prior * sqrt_n / (1 + child._n_visits)
+            if value > best_value:
+                best_value = value
+                best_action = action
+                best_prior = prior
+        child = children.get(best_action)
+        if child is None:
+            child = children[best_action] = LazyTreeNode(self, best_prior)
+            METRICS.inc('mcts_nodes_allocated_total')
+        return best_action, child
+
+    def update_recursive(self, leaf_value):
+        leaf_value = float(leaf_value)
+        node = self
+        while node is not None:
+            node._n_visits += 1
+            node._Q += (leaf_value - node._Q) / node._n_visits
+            leaf_value = -leaf_value
+            node = node._parent
+
+    def is_leaf(self):
+        return self._actions is None
+
+    def is_root(self):
+        return self._parent is None
+
+    def child_visits(self):
+        """Visits of every legal move, including moves never selected"""
+        if self._actions is None:
+            return []
+        children = self._children
+        return [(act, children[act]._n_visits if act in children else 0)
+                for act in self._actions]
+
 class MCTS3D:
-    def __init__(self, policy_value_fn, n_playout, c_puct=5):
-        self._root = TreeNode(None, 1.0)
+    def __init__(self, policy_value_fn, n_playout, c_puct=5, max_nodes=None):
+        # nodes come from a pool when this tree or the process has a node cap
+        self._pool = None
+        if max_nodes is not None or PROCESS_BUDGET.max_nodes is not None:
+            self._pool = NodePool(TreeNode, max_nodes=max_nodes)
+        self._root = self._new_root()
         self._policy = policy_value_fn
         self._c_puct = c_puct
         self._n_playout = n_playout
+        self.last_visits = {}  # root visit counts of the last search
+        self.last_value = None  # Q of the most visited root move, for the side to move
+
+    def _new_root(self):
+        if self._pool is not None:
+            return self._pool.acquire(None, 1.0)
+        return TreeNode(None, 1.0)
+
+    def _make_room(self, leaf, n_needed):
+        """Reclaim the free lists of other trees, then prune the lowest-visit
+        subtrees until n_needed nodes (plus 10% of the cap as slack) fit,
+        never touching the path from the root to leaf.
+        Returns True if the nodes fit.
+        """
+        pool = self._pool
+        if pool.headroom() >= n_needed:
+            return True
+        cap = min(c for c in (pool.max_nodes, PROCESS_BUDGET.max_nodes) if c is not None)
+        target = n_needed + cap // 10
+        # free nodes held by other trees go before any of this tree's nodes
+        pool.reclaim(target)
+        path = set()
+        node = leaf
+        while node is not None:
+            path.add(id(node))
+            node = node._parent
+        candidates = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for child in node._children.values():
+                if child._children:
+                    stack.append(child)
+                    if id(child) not in path:
+                        candidates.append(child)
+        candidates.sort(key=lambda n: n._n_visits)
+        n_pruned = 0
+        for node in candidates:
+            if pool.headroom() >= target:
+                break
+            n_pruned += pool.release_children(node)
+        METRICS.inc('mcts_nodes_pruned_total', n_pruned)
+        return pool.headroom() >= n_needed
 
     def _playout(self, state):
+        timed = METRICS.enabled
+        if timed:
+            t = perf_counter()
         node = self._root
         while(1):
             if node.is_leaf():
                 break
             action, node = node.select(self._c_puct)
             state.do_move(action)
+        if timed:
+            t = METRICS.lap('mcts_phase_seconds', t, phase='select')
 
         # Evaluate state using policy network
         action_probs, leaf_value = self._policy(state)
+        if timed:
+            t = METRICS.lap('mcts_phase_seconds', t, phase='evaluate')
         
         # Check for end of game
         end, winner = state.game_end()
+        if timed:
+            t = METRICS.lap('mcts_phase_seconds', t, phase='game_end')
         if not end:
-            node.expand(action_probs)
+            # under a node cap the leaf stays unexpanded if no room can be made,
+            # except the root, which is always expanded so a search can return a move
+            if self._pool is None:
+                node.expand(action_probs)
+            elif self._make_room(node, len(state.availables)) or node is self._root:
+                node.expand(action_probs, self._pool)
         else:
             # for end state, return the "true" leaf_value
             if winner == -1:  # tie
                 leaf_value = 0.0
             else:
                 leaf_value = (1.0 if winner == state.get_current_player() else -1.0)
+        if timed:
+            t = METRICS.lap('mcts_phase_seconds', t, phase='expand')
 
         node.update_recursive(-leaf_value)
+        if timed:
+            METRICS.lap('mcts_phase_seconds', t, phase='backup')
 
     def get_move_probs(self, state, temp=1e-3):
+        timed = METRICS.enabled
+        if timed:
+            search_start = perf_counter()
         for n in range(self._n_playout):
-            state_copy = copy.deepcopy(state)
+            if timed:
+                t = perf_counter()
+                state_copy = copy.deepcopy(state)
+                METRICS.lap('mcts_phase_seconds', t, phase='deepcopy')
+            else:
+                state_copy = copy.deepcopy(state)
             self._playout(state_copy)
+        if timed:
+            elapsed = perf_counter() - search_start
+            METRICS.observe_time('mcts_search_seconds', elapsed)
+            METRICS.inc('mcts_playouts_total', self._n_playout)
+            if elapsed > 0:
+                METRICS.set_gauge('mcts_playouts_per_second', self._n_playout / elapsed)
+            if self._pool is not None:
+                METRICS.set_gauge('mcts_resident_nodes', PROCESS_BUDGET.resident)
+                METRICS.set_gauge('mcts_resident_bytes',
+                                  (PROCESS_BUDGET.resident + PROCESS_BUDGET.free)
+                                  * self._pool.node_bytes)
 
         # calc the move probabilities based on visit counts at the root node
-        act_visits = [(act, node._n_visits)
-                      for act, node in self._root._children.items()]
+        act_visits = self._root.child_visits()
+        self.last_visits = dict(act_visits)
         acts, visits = zip(*act_visits)
+        # a lazy tree may not have created any child yet (e.g. n_playout=1)
+        best = self._root._children.get(acts[int(np.argmax(visits))])
+        self.last_value = best._Q if best is not None and best._n_visits else None
         act_probs = softmax(1.0/temp * np.log(np.array(visits) + 1e-10))
         return acts, act_probs
 
     def update_with_move(self, last_move):
+        old_root = self._root
         if last_move in self._root._children:
-            self._root = self._root._children[last_move]
+            self._root = self._root._children.pop(last_move)
             self._root._parent = None
+            METRICS.inc('mcts_tree_reuse_total', result='hit')
+            METRICS.inc('mcts_reused_visits_total', self._root._n_visits)
         else:
-            self._root = TreeNode(None, 1.0)
+            METRICS.inc('mcts_tree_reuse_total',
+                        result='reset' if last_move == -1 else 'miss')
+            self._root = self._new_root()
+        if self._pool is not None:
+            # recycle the part of the tree that can no longer be reached
+            self._pool.release_subtree(old_root)
+
+    def memory_stats(self):
+        """Resident nodes and approximate bytes of this tree, or None
+        when the tree is not pooled
+        """
+        return self._pool.stats() if self._pool is not None else None
+
+class LazyMCTS3D(MCTS3D):
+    """MCTS3D over LazyTreeNode: children are created on first selection
+    instead of at expansion. Trees are not pooled, so neither max_nodes nor
+    a process node budget (GOMOKU_MAX_NODES) can be applied.
+    """
+    def __init__(self, policy_value_fn, n_playout, c_puct=5, max_nodes=None):
+        if max_nodes is not None or PROCESS_BUDGET.max_nodes is not None:
+            raise ValueError("LazyMCTS3D trees cannot be capped; "
+                             "use MCTS3D with max_nodes or GOMOKU_MAX_NODES")
+        super().__init__(policy_value_fn, n_playout, c_puct)
+
+    def _new_root(self):
+        return LazyTreeNode(None, 1.0)
 
 class MCTSPlayer:
-    def __init__(self, policy_value_function, n_playout, c_puct=5, is_selfplay=0):
-        self.mcts = MCTS3D(policy_value_function, n_playout, c_puct)
+    def __init__(self, policy_value_function, n_playout, c_puct=5, is_selfplay=0, reuse_tree=0,
+                 max_nodes=None, lazy_expansion=0):
+        mcts_cls = LazyMCTS3D if lazy_expansion else MCTS3D
+        self.mcts = mcts_cls(policy_value_function, n_playout, c_puct, max_nodes)
         self._is_selfplay = is_selfplay
+        # keep the subtree of the chosen move after playing (e.g. for pondering)
+        self._reuse_tree = reuse_tree
 
     def set_player_ind(self, p):
         self.player = p
@@ -128,7 +343,7 @@ class MCTSPlayer:
                 # to choosing the move with the highest prob
                 move = np.random.choice(acts, p=probs)
                 # logging.info(f"Selected move: {move} from acts: {acts} with probs: {probs}")
-                self.mcts.update_with_move(-1)
+                self.mcts.update_with_move(move if self._reuse_tree else -1)
 
             if return_prob:
                 return move, move_probs
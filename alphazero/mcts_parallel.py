@@ -0,0 +1,181 @@
+"""
+Root-parallel MCTS.
+
+n_workers independent MCTS3D trees search the same position and their root
+visit counts are summed before the move probabilities are computed. Workers
+run either as threads sharing one policy function, or as processes that each
+build their own policy from a picklable factory. Every worker but the first
+mixes Dirichlet noise into its root priors so that the trees diverge.
+"""
+
+import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from .mcts_alphaZero_3d import MCTS3D, MCTSPlayer, softmax
+    from .metrics import METRICS, perf_counter
+except ImportError:
+    from mcts_alphaZero_3d import MCTS3D, MCTSPlayer, softmax
+    from metrics import METRICS, perf_counter
+
+
+class NetPolicyFactory(object):
+    """Picklable factory building PolicyValueNet3D.policy_value_fn inside a
+    worker process
+    """
+
+    def __init__(self, model_file, width=4, height=4, depth=4):
+        self.model_file = model_file
+        self.width = width
+        self.height = height
+        self.depth = depth
+
+    def __call__(self):
+        try:
+            from .policy_value_net_tf2_3d import PolicyValueNet3D
+        except ImportError:
+            from policy_value_net_tf2_3d import PolicyValueNet3D
+        policy = PolicyValueNet3D(self.width, self.height, self.depth)
+        policy(np.zeros((1, 4, self.depth, self.height, self.width)))
+        policy.load_weights(self.model_file)
+        return policy.policy_value_fn
+
+
+_worker_policy = None
+
+
+def _init_worker(policy_factory):
+    global _worker_policy
+    _worker_policy = policy_factory()
+
+
+def root_visits(policy_value_fn, board, n_playout, c_puct, seed=None,
+                noise_eps=0.0, noise_alpha=0.3):
+    """Search board with a fresh tree and return {action: root visit count}"""
+    # a local generator: threads must not share or reseed the global one
+    rng = np.random.RandomState(seed)
+    mcts = MCTS3D(policy_value_fn, n_playout, c_puct)
+    mcts._playout(copy.deepcopy(board))  # expand the root
+    children = list(mcts._root._children.values())
+    if noise_eps > 0 and children:
+        noise = rng.dirichlet(noise_alpha * np.ones(len(children)))
+        for child, n in zip(children, noise):
+            child._P = (1 - noise_eps) * child._P + noise_eps * n
+    for n in range(n_playout - 1):
+        mcts._playout(copy.deepcopy(board))
+    return {act: node._n_visits for act, node in mcts._root._children.items()}
+
+
+def _process_task(args):
+    return root_visits(_worker_policy, *args)
+
+
+class RootParallelMCTS(object):
+    """Drop-in replacement for MCTS3D running n_playout playouts in total,
+    split across n_workers trees. Trees are not kept between moves.
+
+    backend: 'thread' shares policy_value_fn between threads (useful when
+        the policy releases the GIL, e.g. TensorFlow inference); 'process'
+        builds one policy per worker process with policy_factory()
+    """
+
+    def __init__(self, policy_value_fn, n_playout, c_puct=5, n_workers=2,
+                 backend='thread', policy_factory=None, noise_eps=0.25, seed=None):
+        if backend not in ('thread', 'process'):
+            raise ValueError("backend must be 'thread' or 'process'")
+        if backend == 'process' and policy_factory is None:
+            raise ValueError("the process backend needs a policy_factory")
+        self._policy = policy_value_fn
+        self._n_playout = n_playout
+        self._c_puct = c_puct
+        self._n_workers = n_workers
+        self._backend = backend
+        self._policy_factory = policy_factory
+        self._noise_eps = noise_eps
+        self._rng = np.random.RandomState(seed)
+        self._pool = None
+        self.last_visits = {}
+        self.last_value = None  # worker trees are discarded, so no root Q is kept
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self._backend == 'process':
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._n_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self._policy_factory,))
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self._n_workers)
+        return self._pool
+
+    def _tasks(self, state):
+        base, extra = divmod(self._n_playout, self._n_workers)
+        seeds = self._rng.randint(0, 2 ** 31 - 1, size=self._n_workers)
+        return [(state,
+                 base + (1 if i < extra else 0),
+                 self._c_puct,
+                 int(seeds[i]),
+                 0.0 if i == 0 else self._noise_eps)
+                for i in range(self._n_workers)]
+
+    def search(self, state):
+        """Return the merged {action: visits} over all workers"""
+        timed = METRICS.enabled
+        if timed:
+            start = perf_counter()
+        tasks = [task for task in self._tasks(state) if task[1] > 0]
+        if self._n_workers == 1:
+            results = [root_visits(self._policy, *tasks[0])]
+        elif self._backend == 'process':
+            results = list(self._get_pool().map(_process_task, tasks))
+        else:
+            results = list(self._get_pool().map(
+                lambda task: root_visits(self._policy, *task), tasks))
+        visits = {}
+        for worker_visits in results:
+            for act, n in worker_visits.items():
+                visits[act] = visits.get(act, 0) + n
+        if timed:
+            elapsed = perf_counter() - start
+            METRICS.observe_time('mcts_search_seconds', elapsed)
+            METRICS.inc('mcts_playouts_total', self._n_playout)
+            if elapsed > 0:
+                METRICS.set_gauge('mcts_playouts_per_second', self._n_playout / elapsed)
+        self.last_visits = visits
+        return visits
+
+    def get_move_probs(self, state, temp=1e-3):
+        visits = self.search(state)
+        acts, counts = zip(*visits.items())
+        act_probs = softmax(1.0/temp * np.log(np.array(counts) + 1e-10))
+        return acts, act_probs
+
+    def update_with_move(self, last_move):
+        # every search starts from fresh trees
+        pass
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class ParallelMCTSPlayer(MCTSPlayer):
+    """MCTSPlayer searching with RootParallelMCTS"""
+
+    def __init__(self, policy_value_function, n_playout, c_puct=5, is_selfplay=0,
+                 n_workers=2, backend='thread', policy_factory=None):
+        super().__init__(policy_value_function, n_playout, c_puct, is_selfplay)
+        self.mcts = RootParallelMCTS(policy_value_function, n_playout, c_puct,
+                                     n_workers=n_workers, backend=backend,
+                                     policy_factory=policy_factory)
+
+    def close(self):
+        self.mcts.close()
+
+    def __str__(self):
+        return "Parallel MCTS {}".format(self.player)
@@ -0,0 +1,210 @@
+"""
+Process-wide counters and timers for the search hot path.
+
+A single registry, METRICS, is shared by the MCTS, the policy-value network
+and the API server. Recording is gated on METRICS.enabled, so the cost when
+disabled is one attribute check per call site. The server exposes the
+registry in the Prometheus text exposition format; offline tools read it
+through snapshot().
+"""
+
+import os
+import threading
+import time
+
+perf_counter = time.perf_counter
+
+# upper bounds of the network batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in pairs) + '}'
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    def __init__(self, registry, name, labels):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._registry.observe_time(self._name, perf_counter() - self._start,
+                                    **self._labels)
+        return False
+
+
+class Metrics(object):
+    """Registry of counters, gauges, timers and histograms.
+    Every metric is identified by a name and an optional set of labels.
+    """
+
+    def __init__(self, enabled=False, prefix='gomoku_'):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._timers = {}      # key -> [count, total seconds]
+            self._histograms = {}  # key -> [bucket counts, count, sum]
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter by value"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe_time(self, name, seconds, **labels):
+        """Add one timed observation (in seconds) to a timer"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            entry = self._timers.get(key)
+            if entry is None:
+                self._timers[key] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def observe(self, name, value, buckets=BATCH_SIZE_BUCKETS, **labels):
+        """Add one observation to a histogram"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = [buckets, [0] * len(buckets), 0, 0]
+                self._histograms[key] = entry
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[1][i] += 1
+                    break
+            entry[2] += 1
+            entry[3] += value
+
+    def timer(self, name, **labels):
+        """Context manager timing its body; a no-op when disabled"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def lap(self, name, start, **labels):
+        """Record the time elapsed since start and return the current clock,
+        so that consecutive phases can be timed with one clock read each.
+        """
+        now = perf_counter()
+        self.observe_time(name, now - start, **labels)
+        return now
+
+    def snapshot(self):
+        """Return all recorded values as plain dicts, keyed by
+        'name{label="value",...}'
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timers = {k: list(v) for k, v in self._timers.items()}
+            histograms = {k: (v[0], list(v[1]), v[2], v[3])
+                          for k, v in self._histograms.items()}
+
+        def flat(key):
+            return key[0] + _format_labels(key[1])
+
+        return {
+            'counters': {flat(k): v for k, v in counters.items()},
+            'gauges': {flat(k): v for k, v in gauges.items()},
+            'timers': {flat(k): {'count': v[0], 'seconds': v[1]}
+                       for k, v in timers.items()},
+            'histograms': {flat(k): {'buckets': dict(zip(v[0], v[1])),
+                                     'count': v[2], 'sum': v[3]}
+                           for k, v in histograms.items()},
+        }
+
+    def render_prometheus(self):
+        """Render the registry in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            timers = sorted((k, list(v)) for k, v in self._timers.items())
+            histograms = sorted((k, (v[0], list(v[1]), v[2], v[3]))
+                                for k, v in self._histograms.items())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        for (name, labels), value in counters:
+            name = self.prefix + name
+            declare(name, 'counter')
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for (name, labels), value in gauges:
+            name = self.prefix + name
+            declare(name, 'gauge')
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for (name, labels), (count, total) in timers:
+            name = self.prefix + name
+            declare(name, 'summary')
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+            lines.append('{}_sum{} {:.9f}'.format(name, _format_labels(labels), total))
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            name = self.prefix + name
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(labels, [('le', bound)]), cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                name, _format_labels(labels, [('le', '+Inf')]), count))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), total))
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics(enabled=os.environ.get('GOMOKU_METRICS', '0') == '1')
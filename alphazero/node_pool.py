@@ -0,0 +1,210 @@
+"""
+Node allocation for memory-bounded search trees.
+
+A NodePool hands out tree nodes for one MCTS tree, recycling released nodes
+through a free list, and enforces two caps: max_nodes per tree and a
+process-wide NodeBudget shared by every pool. Nodes on free lists count
+against the process budget; a pool short of room drops the free lists of
+other pools before the MCTS prunes low-visit subtrees.
+"""
+
+import os
+import sys
+import threading
+import weakref
+
+
+class NodeBudget(object):
+    """Process-wide count of resident and free tree nodes with an
+    optional cap on their sum
+    """
+
+    def __init__(self, max_nodes=None):
+        self.max_nodes = max_nodes
+        self.resident = 0
+        self.free = 0
+        self._lock = threading.Lock()
+        self._pools = weakref.WeakSet()
+
+    def headroom(self):
+        if self.max_nodes is None:
+            return float('inf')
+        return self.max_nodes - self.resident - self.free
+
+    def register(self, pool):
+        with self._lock:
+            self._pools.add(pool)
+
+    def reclaim(self, n, exclude=None):
+        """Drop up to n free nodes from the pools other than exclude.
+        Returns the number of nodes dropped.
+        """
+        with self._lock:
+            pools = [pool for pool in self._pools if pool is not exclude]
+        n_dropped = 0
+        for pool in pools:
+            if n_dropped >= n:
+                break
+            n_dropped += pool.trim(n - n_dropped)
+        return n_dropped
+
+    def _add(self, resident, free=0):
+        with self._lock:
+            self.resident += resident
+            self.free += free
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+PROCESS_BUDGET = NodeBudget(_env_int('GOMOKU_MAX_NODES'))
+
+
+def node_bytes(node_cls):
+    """Approximate memory held by one leaf node: the object, its empty
+    children dict, its float statistics and its entry in the parent's dict
+    """
+    node = node_cls(None, 1.0)
+    return (sys.getsizeof(node) + sys.getsizeof(node._children)
+            + 3 * sys.getsizeof(1.0) + 40)
+
+
+def _release_counts(budget, counts):
+    budget._add(-counts[0], -counts[1])
+
+
+class NodePool(object):
+    """Allocator for the nodes of one tree.
+
+    max_nodes: cap on nodes resident in this tree (None for no cap)
+    max_free: cap on recycled nodes kept for reuse
+    budget: process-wide NodeBudget the pool draws from
+    """
+
+    def __init__(self, node_cls, max_nodes=None, max_free=None, budget=PROCESS_BUDGET):
+        self._node_cls = node_cls
+        self.max_nodes = max_nodes
+        self.max_free = max_free if max_free is not None else (max_nodes or 100000)
+        self.budget = budget
+        self.node_bytes = node_bytes(node_cls)
+        self._free = []
+        # guards the free list, which other pools may trim through the budget
+        self._lock = threading.Lock()
+        # [resident, free], handed back to the budget when the pool is collected
+        self._counts = [0, 0]
+        weakref.finalize(self, _release_counts, budget, self._counts)
+        budget.register(self)
+
+    @property
+    def resident_nodes(self):
+        return self._counts[0]
+
+    @property
+    def free_nodes(self):
+        return len(self._free)
+
+    @property
+    def resident_bytes(self):
+        return (self._counts[0] + len(self._free)) * self.node_bytes
+
+    def headroom(self):
+        """Number of nodes that can still be allocated under both caps.
+        Nodes on this pool's free list are already counted by the budget,
+        so they add to the room left in it.
+        """
+        own = float('inf') if self.max_nodes is None else self.max_nodes - self._counts[0]
+        return min(own, self.budget.headroom() + len(self._free))
+
+    def reclaim(self, n_needed):
+        """Drop free nodes of other pools until n_needed nodes fit in the
+        process budget. Returns the number of nodes dropped.
+        """
+        shortfall = n_needed - self.budget.headroom() - len(self._free)
+        if shortfall <= 0:
+            return 0
+        return self.budget.reclaim(shortfall, exclude=self)
+
+    def trim(self, n):
+        """Drop up to n nodes from the free list; returns the number dropped"""
+        with self._lock:
+            n = min(n, len(self._free))
+            if n:
+                del self._free[-n:]
+                self._account(0, -n)
+        return n
+
+    def acquire(self, parent, prior_p):
+        with self._lock:
+            if self._free:
+                node = self._free.pop()
+                node.reset(parent, prior_p)
+                self._account(1, -1)
+            else:
+                node = self._node_cls(parent, prior_p)
+                self._account(1, 0)
+        return node
+
+    def expand(self, parent, action_priors):
+        """Create the children of parent for every new action, drawing on the
+        free list first. Returns the number of nodes created.
+        """
+        children = parent._children
+        free = self._free
+        node_cls = self._node_cls
+        n_new = n_recycled = 0
+        with self._lock:
+            for action, prob in action_priors:
+                if action not in children:
+                    if free:
+                        node = free.pop()
+                        node.reset(parent, prob)
+                        n_recycled += 1
+                    else:
+                        node = node_cls(parent, prob)
+                    children[action] = node
+                    n_new += 1
+            self._account(n_new, -n_recycled)
+        return n_new
+
+    def release_subtree(self, node):
+        """Return node and all its descendants to the pool.
+        Returns the number of nodes released.
+        """
+        free = self._free
+        n_released = n_kept = 0
+        stack = [node]
+        with self._lock:
+            while stack:
+                n = stack.pop()
+                stack.extend(n._children.values())
+                n._children.clear()
+                n._parent = None
+                n_released += 1
+                if len(free) < self.max_free:
+                    free.append(n)
+                    n_kept += 1
+            self._account(-n_released, n_kept)
+        return n_released
+
+    def release_children(self, node):
+        """Turn node back into a leaf, releasing everything below it"""
+        n_released = 0
+        for child in list(node._children.values()):
+            n_released += self.release_subtree(child)
+        node._children.clear()
+        return n_released
+
+    def _account(self, resident, free):
+        self._counts[0] += resident
+        self._counts[1] += free
+        self.budget._add(resident, free)
+
+    def stats(self):
+        return {
+            'resident_nodes': self.resident_nodes,
+            'free_nodes': self.free_nodes,
+            'resident_bytes': self.resident_bytes,
+            'max_nodes': self.max_nodes,
+        }
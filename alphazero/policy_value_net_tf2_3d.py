@@ -1,6 +1,11 @@
 import tensorflow as tf
 import numpy as np
 
+try:
+    from .metrics import METRICS
+except ImportError:
+    from metrics import METRICS
+
 class PolicyValueNet3D(tf.keras.Model):
     def __init__(self, board_width, board_height, board_depth, l2_const=1e-4):
         super().__init__()
@@ -49,7 +54,13 @@ class PolicyValueNet3D(tf.keras.Model):
         dummy_input = tf.zeros((1, 4, board_depth, board_height, board_width))
         self(dummy_input)
 
-    def call(self, inputs):
+        # Single-head inference graphs, traced once for any batch size
+        input_signature = [tf.TensorSpec([None, 4, board_depth, board_height, board_width],
+                                         tf.float32)]
+        self._value_forward = tf.function(self._value_inference, input_signature=input_signature)
+        self._policy_forward = tf.function(self._policy_inference, input_signature=input_signature)
+
+    def _trunk(self, inputs):
         # Reshape input from (batch, channels, depth, height, width) to (batch, depth, height, width, channels)
         x = tf.transpose(inputs, [0, 2, 3, 4, 1])
         
@@ -66,21 +77,30 @@ class PolicyValueNet3D(tf.keras.Model):
         x = self.conv3(x)
         x = self.batch_norm3(x)
         x = tf.keras.layers.add([x, residual])  # Second residual connection
-        
-        # Policy head
+        return x
+
+    def _policy_head(self, x):
         policy = self.policy_conv(x)
         policy = self.policy_flatten(policy)
         policy = self.policy_dropout(policy)
-        policy = self.policy_fc(policy)
-        
-        # Value head
+        return self.policy_fc(policy)
+
+    def _value_head(self, x):
         value = self.value_conv(x)
         value = self.value_flatten(value)
         value = self.value_dropout(value)
         value = self.value_fc1(value)
-        value = self.value_fc2(value)
-        
-        return policy, value
+        return self.value_fc2(value)
+
+    def call(self, inputs):
+        x = self._trunk(inputs)
+        return self._policy_head(x), self._value_head(x)
+
+    def _value_inference(self, state_batch):
+        return self._value_head(self._trunk(state_batch))
+
+    def _policy_inference(self, state_batch):
+        return self._policy_head(self._trunk(state_batch))
 
     @tf.function
     def train_on_batch(self, state_batch, mcts_probs, winner_batch):
@@ -107,16 +127,19 @@ class PolicyValueNet3D(tf.keras.Model):
         return float(total_loss), float(entropy)
 
     def predict(self, state_batch):
-        state_batch_tensor = tf.convert_to_tensor(state_batch, dtype=tf.float32)
-        policy, value = self(state_batch_tensor)
-        return policy.numpy(), value.numpy()
+        METRICS.observe('network_batch_size', len(state_batch))
+        with METRICS.timer('network_seconds', stage='forward'):
+            state_batch_tensor = tf.convert_to_tensor(state_batch, dtype=tf.float32)
+            policy, value = self(state_batch_tensor)
+            return policy.numpy(), value.numpy()
 
     def policy_value_fn(self, board):
         """Input: board state
            Output: probability of actions, state value"""
         legal_positions = board.availables
-        current_state = np.ascontiguousarray(board.current_state().reshape(
-            -1, 4, self.board_depth, self.board_height, self.board_width))
+        with METRICS.timer('network_seconds', stage='current_state'):
+            current_state = np.ascontiguousarray(board.current_state().reshape(
+                -1, 4, self.board_depth, self.board_height, self.board_width))
         
         action_probs, value = self.predict(current_state)
         act_probs = zip(legal_positions, action_probs[0][legal_positions])
@@ -127,6 +150,27 @@ class PolicyValueNet3D(tf.keras.Model):
            Output: a batch of action probabilities and state values"""
         return self.predict(state_batch)
 
+    def value_only(self, state_batch):
+        """Input: a batch of states
+           Output: a batch of state values, without computing the policy head"""
+        METRICS.observe('network_batch_size', len(state_batch))
+        with METRICS.timer('network_seconds', stage='value_forward'):
+            return self._value_forward(tf.convert_to_tensor(state_batch, dtype=tf.float32)).numpy()
+
+    def policy_only(self, state_batch):
+        """Input: a batch of states
+           Output: a batch of action probabilities, without computing the value head"""
+        METRICS.observe('network_batch_size', len(state_batch))
+        with METRICS.timer('network_seconds', stage='policy_forward'):
+            return self._policy_forward(tf.convert_to_tensor(state_batch, dtype=tf.float32)).numpy()
+
+    def value_fn(self, board):
+        """Input: board state
+           Output: state value for the current player"""
+        current_state = np.ascontiguousarray(board.current_state().reshape(
+            -1, 4, self.board_depth, self.board_height, self.board_width))
+        return self.value_only(current_state)[0][0]
+
     def save_model(self, model_path):
         """Save model weights"""
         self.save_weights(model_path)
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Pondering: keep searching on the opponent's time.
+
+After the AI has played, a Ponderer runs playouts in a background thread on
+the position the opponent now faces, growing the same MCTS3D tree the player
+will search next. When the opponent's move arrives the matching subtree is
+promoted with update_with_move, so its visits carry over into the next search.
+"""
+
+import copy
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from .metrics import METRICS
+except ImportError:
+    from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class ForegroundGate(object):
+    """Tracks foreground searches. Ponder threads hold the GIL while they run
+    playouts, so they pause whenever a foreground search is in progress.
+    """
+
+    def __init__(self):
+        self._active = 0
+        self._idle = threading.Condition()
+
+    @contextmanager
+    def searching(self):
+        with self._idle:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._active -= 1
+                if not self._active:
+                    self._idle.notify_all()
+
+    def wait_idle(self, timeout):
+        """Wait until no foreground search runs; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._active, timeout)
+
+
+class Ponderer(object):
+    """Background search for one game.
+
+    mcts: the MCTS3D tree of the player, rooted at the position being pondered
+    max_playouts, max_seconds: budget of a single ponder
+    slots: semaphore shared by all games limiting concurrent ponder threads;
+        when no slot is free the game does not ponder but keeps its tree
+    gate: ForegroundGate shared by all games; pondering pauses while any
+        foreground search runs
+    """
+
+    def __init__(self, mcts, max_playouts=2000, max_seconds=30.0, slots=None, gate=None):
+        self.mcts = mcts
+        self.max_playouts = max_playouts
+        self.max_seconds = max_seconds
+        self._slots = slots
+        self._gate = gate
+        self._stop = threading.Event()
+        self._thread = None
+        self.moves = None  # move list of the position the tree is rooted at
+        self.playouts = 0
+
+    def start(self, board, moves):
+        """Start pondering on board, the position after the AI's move. The
+        tree root must already correspond to board.
+        """
+        self.stop()
+        self.moves = list(moves)
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            METRICS.inc('ponder_skipped_total')
+            return False
+        self.playouts = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(copy.deepcopy(board),),
+                                        daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, board):
+        deadline = time.time() + self.max_seconds
+        try:
+            while (not self._stop.is_set() and self.playouts < self.max_playouts
+                   and time.time() < deadline):
+                if self._gate is not None and not self._gate.wait_idle(0.05):
+                    continue  # re-check stop and the deadline while paused
+                self.mcts._playout(copy.deepcopy(board))
+                self.playouts += 1
+        except Exception:
+            logger.exception("Pondering failed")
+        finally:
+            METRICS.inc('ponder_playouts_total', self.playouts)
+            if self._slots is not None:
+                self._slots.release()
+
+    def stop(self, wait=True):
+        """Stop the background search, waiting for the current playout"""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def take_tree(self, moves):
+        """Stop pondering and advance the tree to the position reached by
+        moves. Returns the number of visits inherited, or None on a miss
+        (moves does not extend the pondered position by one move, or the
+        opponent's move was never explored), in which case the tree is reset.
+        """
+        self.stop()
+        pondered = self.moves
+        self.moves = None
+        if pondered is None:
+            self.mcts.update_with_move(-1)
+            return None
+        if len(moves) == len(pondered) + 1 and list(moves[:-1]) == pondered:
+            last_move = moves[-1]
+            child = self.mcts._root._children.get(last_move)
+            if child is not None and child._n_visits > 0:
+                self.mcts.update_with_move(last_move)
+                METRICS.inc('ponder_total', result='hit')
+                METRICS.inc('ponder_inherited_visits_total', child._n_visits)
+                return child._n_visits
+        METRICS.inc('ponder_total', result='miss')
+        self.mcts.update_with_move(-1)
+        return None
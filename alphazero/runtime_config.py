@@ -0,0 +1,262 @@
+"""
+TensorFlow thread pools and CPU affinity for inference processes.
+
+Settings come from the environment (or a JSON file written by the tuner)
+and must be applied before TensorFlow runs its first op:
+
+    GOMOKU_TF_INTRA_OP_THREADS  threads used inside one op (0 = TF default)
+    GOMOKU_TF_INTER_OP_THREADS  ops run concurrently (0 = TF default)
+    GOMOKU_CPU_AFFINITY         CPUs to pin the process to, e.g. "0-3,8",
+                                or "slice:I/N" for the I-th of N equal shares
+    GOMOKU_WORKER_INDEX         index of this worker among the workers of
+                                the config file; pins the process to its
+                                share of the CPUs unless GOMOKU_CPU_AFFINITY
+                                is set
+    GOMOKU_RUNTIME_CONFIG       JSON file with the keys intra_op_threads,
+                                inter_op_threads, workers and cpu_affinity;
+                                the variables above override it
+
+The tuner sweeps thread settings in fresh subprocesses against the predict
+workload of inference_workload.py (also timed by the inference benchmark)
+and writes the best one. The file is shared by all workers, so it records
+the number of workers rather than any one worker's CPUs:
+
+    python runtime_config.py tune --workers 4 --output runtime.json
+    GOMOKU_RUNTIME_CONFIG=runtime.json GOMOKU_WORKER_INDEX=2 python ../api_server.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+
+try:
+    from . import inference_workload
+except ImportError:
+    import inference_workload
+
+logger = logging.getLogger(__name__)
+
+ENV_INTRA = 'GOMOKU_TF_INTRA_OP_THREADS'
+ENV_INTER = 'GOMOKU_TF_INTER_OP_THREADS'
+ENV_AFFINITY = 'GOMOKU_CPU_AFFINITY'
+ENV_WORKER_INDEX = 'GOMOKU_WORKER_INDEX'
+ENV_CONFIG = 'GOMOKU_RUNTIME_CONFIG'
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(spec):
+    """CPUs named by spec: a list such as "0-3,8", or "slice:I/N" for the
+    I-th (0-based) of N equal shares of the CPUs available to the process
+    """
+    spec = spec.strip()
+    if spec.startswith('slice:'):
+        index, count = (int(n) for n in spec[len('slice:'):].split('/'))
+        if not 0 <= index < count:
+            raise ValueError("Invalid CPU slice {!r}".format(spec))
+        cpus = available_cpus()
+        share = max(1, len(cpus) // count)
+        start = (index * share) % len(cpus)
+        return cpus[start:start + share]
+    cpus = set()
+    for part in spec.split(','):
+        if '-' in part:
+            first, last = (int(n) for n in part.split('-'))
+            cpus.update(range(first, last + 1))
+        elif part:
+            cpus.add(int(part))
+    if not cpus:
+        raise ValueError("Invalid CPU list {!r}".format(spec))
+    return sorted(cpus)
+
+
+def runtime_settings(**overrides):
+    """Settings from GOMOKU_RUNTIME_CONFIG, the environment variables and
+    overrides (later sources win). None means leave the default. A worker
+    index with more than one worker selects the worker's CPU slice when no
+    CPU list is given.
+    """
+    settings = {'intra_op_threads': None, 'inter_op_threads': None, 'workers': None,
+                'worker_index': None, 'cpu_affinity': None}
+    path = os.environ.get(ENV_CONFIG)
+    if path:
+        with open(path) as f:
+            settings.update((k, v) for k, v in json.load(f).items() if k in settings)
+    for key, name in (('intra_op_threads', ENV_INTRA), ('inter_op_threads', ENV_INTER),
+                      ('worker_index', ENV_WORKER_INDEX)):
+        if os.environ.get(name):
+            settings[key] = int(os.environ[name])
+    if os.environ.get(ENV_AFFINITY):
+        settings['cpu_affinity'] = os.environ[ENV_AFFINITY]
+    settings.update((k, v) for k, v in overrides.items() if v is not None)
+    workers = settings['workers'] or 1
+    if not settings['cpu_affinity'] and workers > 1:
+        if settings['worker_index'] is None:
+            logger.warning("Settings tuned for %d workers but %s is not set; "
+                           "not pinning CPUs", workers, ENV_WORKER_INDEX)
+        else:
+            settings['cpu_affinity'] = 'slice:{}/{}'.format(settings['worker_index'], workers)
+    return settings
+
+
+def configure_runtime(**overrides):
+    """Apply the CPU affinity and TF thread settings to this process.
+    Call before TensorFlow executes any op. Returns the applied settings,
+    with cpu_affinity resolved to a list of CPUs.
+    """
+    settings = runtime_settings(**overrides)
+    if settings['cpu_affinity']:
+        cpus = settings['cpu_affinity']
+        if isinstance(cpus, str):
+            cpus = parse_cpu_list(cpus)
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        else:
+            logger.warning("CPU affinity is not supported on this platform, ignoring %s", cpus)
+        settings['cpu_affinity'] = list(cpus)
+
+    import tensorflow as tf
+    try:
+        if settings['intra_op_threads'] is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(settings['intra_op_threads'])
+        if settings['inter_op_threads'] is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(settings['inter_op_threads'])
+    except RuntimeError as e:
+        # TF refuses once its runtime is initialised
+        logger.warning("TensorFlow thread settings not applied: %s", e)
+    settings['intra_op_threads'] = tf.config.threading.get_intra_op_parallelism_threads()
+    settings['inter_op_threads'] = tf.config.threading.get_inter_op_parallelism_threads()
+    return settings
+
+
+def describe_runtime(settings):
+    """One line for the startup log; 0 threads means TF picks the count"""
+    cpus = settings.get('cpu_affinity') or available_cpus()
+    return "TF intra-op threads: {}, inter-op threads: {}, CPUs: {}".format(
+        settings['intra_op_threads'] or 'default', settings['inter_op_threads'] or 'default',
+        format_cpu_list(cpus))
+
+
+def format_cpu_list(cpus):
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in ranges)
+
+
+def measure(args):
+    """Run the predict workload under the given settings and print one JSON
+    line of latency percentiles (ms) and throughput (states/s) per batch size
+    """
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+    settings = configure_runtime(intra_op_threads=args.intra, inter_op_threads=args.inter,
+                                 cpu_affinity=args.cpus)
+    net = inference_workload.load_network()
+    report = {'settings': settings, 'batches': {}}
+    for batch_size, states in inference_workload.workload_states(args.batch_sizes):
+        times = inference_workload.time_predict(net, states, args.repeat)
+        report['batches'][str(batch_size)] = inference_workload.latency_stats(times, batch_size)
+    print(json.dumps(report))
+
+
+def candidate_settings(n_cpus):
+    """Thread counts to try: powers of two up to the CPU share, 1 or 2
+    inter-op threads, plus the TF defaults (0, 0)
+    """
+    intra = sorted({1 << i for i in range(n_cpus.bit_length()) if 1 << i <= n_cpus} | {n_cpus})
+    return [(0, 0)] + [(a, b) for a in intra for b in (1, 2)]
+
+
+def score(report, objective, batch_size):
+    stats = report['batches'][str(batch_size)]
+    if objective == 'throughput':
+        return -stats['throughput']
+    return stats[objective + '_ms']
+
+
+def tune(args):
+    """Measure every candidate in a fresh process (TF thread pools cannot be
+    changed once created), pinned to the CPU share of one of args.workers
+    workers, and write the best settings to args.output
+    """
+    cpus = available_cpus()
+    affinity = 'slice:0/{}'.format(args.workers) if args.workers > 1 else None
+    share = max(1, len(cpus) // args.workers)
+    results = []
+    for intra, inter in candidate_settings(share):
+        cmd = [sys.executable, os.path.abspath(__file__), 'measure', '--intra', str(intra),
+               '--inter', str(inter), '--repeat', str(args.repeat),
+               '--batch-sizes'] + [str(b) for b in args.batch_sizes]
+        if affinity:
+            cmd += ['--cpus', affinity]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, check=True,
+                             universal_newlines=True).stdout
+        report = json.loads(out.strip().splitlines()[-1])
+        value = score(report, args.objective, args.batch_sizes[0])
+        results.append((value, intra, inter, report))
+        print("intra={:<3} inter={:<2} {}".format(intra or 'def', inter or 'def', '  '.join(
+            'batch {}: p50 {:.2f} ms p95 {:.2f} ms'.format(b, s['p50_ms'], s['p95_ms'])
+            for b, s in report['batches'].items())))
+
+    value, intra, inter, report = min(results, key=lambda r: r[0])
+    best = {
+        'intra_op_threads': intra or None,
+        'inter_op_threads': inter or None,
+        'workers': args.workers,
+        'objective': args.objective,
+        'batch_size': args.batch_sizes[0],
+        'batches': report['batches'],
+    }
+    print("Best: intra-op {}, inter-op {} ({} at batch {}: {:.2f})".format(
+        intra or 'default', inter or 'default', args.objective, args.batch_sizes[0], abs(value)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(best, f, indent=2)
+        print("Settings written to {}; use them with {}={}{}".format(
+            args.output, ENV_CONFIG, args.output,
+            ' and {}=0..{} per worker'.format(ENV_WORKER_INDEX, args.workers - 1)
+            if args.workers > 1 else ''))
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TensorFlow runtime settings for 3D Gomoku')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    # the network, input batches and batch sizes of inference_workload.py
+    for name in ('measure', 'tune'):
+        p = sub.add_parser(name)
+        p.add_argument('--repeat', type=int, default=20)
+        p.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8],
+                       help='the first batch size is the one the tuner optimises')
+    p = sub.choices['measure']
+    p.add_argument('--intra', type=int, default=None)
+    p.add_argument('--inter', type=int, default=None)
+    p.add_argument('--cpus', default=None, help='CPU list or slice:I/N')
+    p = sub.choices['tune']
+    p.add_argument('--workers', type=int, default=1,
+                   help='inference workers that will share the CPUs')
+    p.add_argument('--objective', choices=('p95', 'p50', 'throughput'), default='p95')
+    p.add_argument('--output', help='write the best settings to this JSON file')
+
+    args = parser.parse_args(argv)
+    if args.command == 'measure':
+        measure(args)
+    else:
+        tune(args)
+
+
+if __name__ == '__main__':
+    main()
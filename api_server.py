@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
 import numpy as np
@@ -6,15 +6,21 @@ import tensorflow as tf
 import logging
 import time
 import sys
+import threading
 import traceback
 
 # Add alphazero directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'alphazero'))
 
 # Import alphazero modules
-from alphazero.game_3d import Board3D, Game3D
 from alphazero.mcts_alphaZero_3d import MCTSPlayer
 from alphazero.policy_value_net_tf2_3d import PolicyValueNet3D
+from alphazero.metrics import METRICS
+from alphazero.analysis import analyze_positions, board_from_moves, new_board, pieces_to_moves
+from alphazero.game_sessions import GameSessionError, GameSessionStore
+from alphazero.ponder import ForegroundGate, Ponderer
+from alphazero.node_pool import PROCESS_BUDGET
+from alphazero.runtime_config import configure_runtime, describe_runtime
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -27,6 +33,14 @@ os.environ["CUDA_VISIBLE_DEVICES"] = "-1"  # Use CPU
 tf.get_logger().setLevel(logging.ERROR)
 tf.keras.utils.disable_interactive_logging()
 
+# Thread pools and CPU pinning from GOMOKU_TF_* / GOMOKU_CPU_AFFINITY, before TF runs any op
+RUNTIME_SETTINGS = configure_runtime()
+logger.info(describe_runtime(RUNTIME_SETTINGS))
+
+# Search instrumentation is on by default for the server; GOMOKU_METRICS=0 disables it
+if os.environ.get('GOMOKU_METRICS', '1') != '0':
+    METRICS.enable()
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend requests
@@ -34,11 +48,30 @@ CORS(app)  # Enable CORS for frontend requests
 # Game parameters
 GRID_SIZE = 4
 N_IN_ROW = 4  # Number in a row to win
+PROTOCOL_VERSION = 2  # Latest /api/ai-move protocol, see request_to_board
+SESSION_TTL = int(os.environ.get('GOMOKU_SESSION_TTL', 1800))  # Seconds an idle game is kept
+AI_C_PUCT = 4
+AI_N_PLAYOUT = 200  # Higher playouts for better performance
+# Pondering: session games keep searching on the opponent's time
+PONDER_ENABLED = os.environ.get('GOMOKU_PONDER', '1') != '0'
+PONDER_MAX_PLAYOUTS = int(os.environ.get('GOMOKU_PONDER_MAX_PLAYOUTS', 2000))
+PONDER_MAX_SECONDS = float(os.environ.get('GOMOKU_PONDER_MAX_SECONDS', 30))
+# Concurrent ponder threads. Playouts are GIL-bound, so extra slots add no throughput
+# and only slow down every foreground search
+PONDER_SLOTS = int(os.environ.get('GOMOKU_PONDER_SLOTS', 1))
+# Node cap per session search tree; GOMOKU_MAX_NODES caps all trees of the process
+MAX_TREE_NODES = int(os.environ['GOMOKU_MAX_TREE_NODES']) if os.environ.get('GOMOKU_MAX_TREE_NODES') else None
+MAX_ANALYZE_POSITIONS = 4096  # Positions accepted per /api/analyze request
+MAX_ANALYZE_PLAYOUTS = int(os.environ.get('GOMOKU_MAX_ANALYZE_PLAYOUTS', 2000))  # Per position in search mode
+MAX_ANALYZE_WORKERS = int(os.environ.get('GOMOKU_MAX_ANALYZE_WORKERS', 4))  # Search threads per request
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'alphazero/policy_3d_iter_100_2nd.weights.h5')
 
 # Global variables to cache the model
 best_policy = None
 mcts_player = None
+game_sessions = GameSessionStore(ttl=SESSION_TTL)
+ponder_slots = threading.BoundedSemaphore(PONDER_SLOTS)
+foreground_searches = ForegroundGate()  # Pondering pauses while any request is searching
 
 def initialize_ai():
     """Initialize the AI model and player"""
@@ -64,8 +97,8 @@ def initialize_ai():
         # Create the AI player
         mcts_player = MCTSPlayer(
             best_policy.policy_value_fn,
-            c_puct=4,
-            n_playout=200,  # Higher playouts for better performance
+            c_puct=AI_C_PUCT,
+            n_playout=AI_N_PLAYOUT,
             is_selfplay=0  # Make sure this is 0 for human play
         )
         mcts_player.set_player_ind(1)  # AI is player 1 (white)
@@ -78,42 +111,50 @@ def initialize_ai():
 
 def frontend_to_board(pieces):
     """Convert frontend piece representation to backend board state"""
-    # Create a new board
-    board = Board3D(width=GRID_SIZE, height=GRID_SIZE, depth=GRID_SIZE, n_in_row=N_IN_ROW)
-    board.init_board(0)  # Initialize with black as first player
-    
-    # Place all pieces on the board in the correct sequence
-    black_pieces = [p for p in pieces if p['color'] == 'black']
-    white_pieces = [p for p in pieces if p['color'] == 'white']
-    
-    # Black always starts, so we should have equal or one more black piece
-    if len(black_pieces) < len(white_pieces):
-        raise ValueError("Invalid game state: white has more pieces than black")
-    
-    if len(black_pieces) > len(white_pieces) + 1:
-        raise ValueError("Invalid game state: black has too many extra pieces")
-    
-    # Place pieces in alternating order
-    for i in range(max(len(black_pieces), len(white_pieces))):
-        # Place black piece if available
-        if i < len(black_pieces):
-            piece = black_pieces[i]
-            pos = (piece['position']['z'], piece['position']['y'], piece['position']['x'])
-            move = board.location_to_move(pos)
-            board.do_move(move)
-        
-        # Place white piece if available
-        if i < len(white_pieces):
-            piece = white_pieces[i]
-            pos = (piece['position']['z'], piece['position']['y'], piece['position']['x'])
-            move = board.location_to_move(pos)
-            board.do_move(move)
-    
-    return board
+    board_kwargs = dict(width=GRID_SIZE, height=GRID_SIZE, depth=GRID_SIZE, n_in_row=N_IN_ROW)
+    # Place pieces in alternating order, black first
+    moves = pieces_to_moves(pieces, new_board(**board_kwargs))
+    return board_from_moves(moves, **board_kwargs)
 
-def get_ai_move(board):
-    """Get the AI's next move using MCTS"""
-    move = mcts_player.get_action(board)
+def request_to_board(data):
+    """Build the board for an /api/ai-move request.
+
+    Protocol 1 sends the full frontend pieces list. Protocol 2 sends either
+    the ordered move list ('moves', optionally with a 'gameId' to open a
+    session) or only the latest move of a known session ('gameId' and
+    'lastMove', optionally 'moveCount' as a consistency check).
+    Returns (board, moves, session); session is None for stateless requests.
+    """
+    if int(data.get('protocol', 1)) < PROTOCOL_VERSION:
+        pieces_data = data.get('pieces', [])
+        logger.info(f"Received {len(pieces_data)} pieces")
+        return frontend_to_board(pieces_data), None, None
+
+    board_kwargs = dict(width=GRID_SIZE, height=GRID_SIZE, depth=GRID_SIZE, n_in_row=N_IN_ROW)
+    game_id = data.get('gameId')
+    if 'moves' in data:
+        moves = data['moves']
+        if not isinstance(moves, list):
+            raise ValueError("'moves' must be a list of move indices")
+        session = None
+        if game_id is not None:
+            session = game_sessions.get(game_id) or game_sessions.create(game_id=game_id)
+    else:
+        if game_id is None:
+            raise ValueError("Protocol 2 requests need 'moves' or 'gameId'")
+        session = game_sessions.get(game_id)
+        if session is None:
+            raise GameSessionError(f"Unknown or expired game id {game_id}")
+        moves = list(session.moves)
+        if data.get('lastMove') is not None:
+            moves.append(data['lastMove'])
+    if 'moveCount' in data and int(data['moveCount']) != len(moves):
+        raise GameSessionError(
+            f"Move count mismatch: server has {len(moves)}, client has {data['moveCount']}")
+    logger.info(f"Received {len(moves)} moves")
+    return board_from_moves(moves, **board_kwargs), moves, session
+
+def move_to_frontend(board, move):
     location = board.move_to_location(move)
     return {
         'z': int(location[0]),  # Convert np.int64 to regular Python int
@@ -121,6 +162,40 @@ def get_ai_move(board):
         'x': int(location[2])   # Convert np.int64 to regular Python int
     }
 
+def get_ai_move(board):
+    """Get the AI's next move using MCTS"""
+    with foreground_searches.searching():
+        move = mcts_player.get_action(board)
+    return int(move), move_to_frontend(board, move)
+
+def get_pondered_ai_move(session, board, moves):
+    """Get the AI's next move for a session game, starting from the tree
+    pondered since the AI's previous move, then ponder on the new position.
+    Returns (move, location, inherited visits or None on a ponder miss).
+    """
+    with session.lock:
+        if session.player is None:
+            session.player = MCTSPlayer(
+                best_policy.policy_value_fn,
+                c_puct=AI_C_PUCT,
+                n_playout=AI_N_PLAYOUT,
+                is_selfplay=0,
+                reuse_tree=1,  # Keep the subtree of the AI's move for pondering
+                max_nodes=MAX_TREE_NODES
+            )
+            session.player.set_player_ind(1)
+            session.ponderer = Ponderer(session.player.mcts, PONDER_MAX_PLAYOUTS,
+                                        PONDER_MAX_SECONDS, ponder_slots, foreground_searches)
+        inherited = session.ponderer.take_tree(moves)
+        with foreground_searches.searching():
+            move = int(session.player.get_action(board))
+        location = move_to_frontend(board, move)
+        session.moves = moves + [move]
+        board.do_move(move)
+        if not board.game_end()[0]:
+            session.ponderer.start(board, moves + [move])
+    return move, location, inherited
+
 @app.route('/api/ai-move', methods=['POST'])
 def ai_move():
     start_time = time.time()
@@ -132,12 +207,8 @@ def ai_move():
         # Make sure the AI is initialized
         initialize_ai()
         
-        # Get piece data from request
-        pieces_data = request.json.get('pieces', [])
-        logger.info(f"Received {len(pieces_data)} pieces")
-        
-        # Convert frontend representation to backend board
-        board = frontend_to_board(pieces_data)
+        # Convert the request to a backend board
+        board, moves, session = request_to_board(request.json)
         
         # Check if the game is already over
         end, winner = board.game_end()
@@ -149,7 +220,17 @@ def ai_move():
         
         # Get AI move
         logger.info("Computing AI move...")
-        move_location = get_ai_move(board)
+        ponder = None
+        if session is not None and PONDER_ENABLED:
+            move, move_location, inherited = get_pondered_ai_move(session, board, moves)
+            ponder = {'hit': inherited is not None, 'inheritedVisits': inherited or 0}
+            logger.info(f"Ponder {'hit' if inherited is not None else 'miss'}, "
+                        f"inherited {inherited or 0} visits")
+        else:
+            move, move_location = get_ai_move(board)
+            if session is not None:
+                with session.lock:
+                    session.moves = moves + [move]
         
         # Convert to frontend coordinate system
         ai_move = {
@@ -160,16 +241,103 @@ def ai_move():
         
         processing_time = time.time() - start_time
         logger.info(f"AI move computed in {processing_time:.2f} seconds: {ai_move}")
+        METRICS.inc('api_requests_total', endpoint='ai-move', status='ok')
+        METRICS.observe_time('api_request_seconds', processing_time, endpoint='ai-move')
         
-        return jsonify({
+        response = {
             'move': ai_move,
             'source': 'alphazero',
             'processingTime': processing_time
-        })
+        }
+        if moves is not None:
+            response['moveIndex'] = move
+            response['moveCount'] = len(moves) + 1
+        if session is not None:
+            response['gameId'] = session.game_id
+        if ponder is not None:
+            response['ponder'] = ponder
+        return jsonify(response)
         
+    except GameSessionError as e:
+        logger.warning(f"Session error: {str(e)}")
+        METRICS.inc('api_requests_total', endpoint='ai-move', status='resync')
+        return jsonify({
+            'error': str(e),
+            'resync': True
+        }), 409
+    except ValueError as e:
+        logger.warning(f"Invalid AI move request: {str(e)}")
+        METRICS.inc('api_requests_total', endpoint='ai-move', status='invalid')
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error processing AI move: {str(e)}")
         logger.error(traceback.format_exc())
+        METRICS.inc('api_requests_total', endpoint='ai-move', status='error')
+        return jsonify({
+            'error': str(e)
+        }), 500
+
+def bounded_int(data, key, default, maximum):
+    """Read a positive integer request parameter, clamped to maximum.
+    Raises ValueError for values that are not positive integers.
+    """
+    value = data.get(key, default)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError(f"'{key}' must be a positive integer")
+    return min(value, maximum)
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze():
+    """Evaluate a batch of positions given as move lists or pieces lists.
+    mode 'raw' uses one batched network call, mode 'search' runs a full
+    MCTS per position in parallel, modes 'value' and 'rank' use the
+    value-only network path.
+    """
+    start_time = time.time()
+    try:
+        initialize_ai()
+
+        positions = request.json.get('positions', [])
+        mode = request.json.get('mode', 'raw')
+        if not isinstance(positions, list):
+            return jsonify({'error': "'positions' must be a list"}), 400
+        if len(positions) > MAX_ANALYZE_POSITIONS:
+            return jsonify({
+                'error': f'Too many positions, at most {MAX_ANALYZE_POSITIONS} per request'
+            }), 400
+        if mode not in ('raw', 'search', 'value', 'rank'):
+            return jsonify({'error': f'Unknown analysis mode: {mode}'}), 400
+        try:
+            n_playout = bounded_int(request.json, 'nPlayout', 200, MAX_ANALYZE_PLAYOUTS)
+            n_workers = bounded_int(request.json, 'workers', MAX_ANALYZE_WORKERS,
+                                    MAX_ANALYZE_WORKERS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        logger.info(f"Analyzing {len(positions)} positions, mode: {mode}")
+
+        # analysis competes with game moves for the CPU, so pondering pauses too
+        with foreground_searches.searching():
+            results = analyze_positions(
+                positions, best_policy, mode=mode,
+                n_playout=n_playout,
+                c_puct=4,
+                n_workers=n_workers,
+                width=GRID_SIZE, height=GRID_SIZE, depth=GRID_SIZE, n_in_row=N_IN_ROW)
+
+        processing_time = time.time() - start_time
+        METRICS.inc('api_requests_total', endpoint='analyze', status='ok')
+        METRICS.observe_time('api_request_seconds', processing_time, endpoint='analyze')
+        return jsonify({
+            'results': results,
+            'processingTime': processing_time
+        })
+
+    except Exception as e:
+        logger.error(f"Error analyzing positions: {str(e)}")
+        logger.error(traceback.format_exc())
+        METRICS.inc('api_requests_total', endpoint='analyze', status='error')
         return jsonify({
             'error': str(e)
         }), 500
@@ -179,9 +347,19 @@ def health_check():
     """Simple health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'aiInitialized': best_policy is not None
+        'aiInitialized': best_policy is not None,
+        'protocol': PROTOCOL_VERSION,
+        'sessions': len(game_sessions),
+        'residentNodes': PROCESS_BUDGET.resident,
+        'runtime': RUNTIME_SETTINGS
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Search and request metrics in the Prometheus text exposition format"""
+    return Response(METRICS.render_prometheus(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     try:
         # Initialize AI on startup
@@ -0,0 +1,56 @@
+"""End-to-end /api/ai-move latency against a running server under concurrent load."""
+
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import GRID_SIZE, STAGES, percentile, random_moves, result
+
+CONCURRENCY = (1, 4, 8)
+
+
+def pieces_for(moves):
+    """Frontend pieces list for a move sequence, black first"""
+    pieces = []
+    for i, move in enumerate(moves):
+        d, rem = divmod(move, GRID_SIZE * GRID_SIZE)
+        h, w = divmod(rem, GRID_SIZE)
+        pieces.append({'id': i,
+                       'color': 'black' if i % 2 == 0 else 'white',
+                       'position': {'x': w, 'y': h, 'z': d}})
+    return pieces
+
+
+def post_move(url, pieces, request_id):
+    body = json.dumps({'pieces': pieces, 'requestId': request_id}).encode('utf-8')
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=300) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def run(args):
+    if not args.url:
+        return []
+    url = args.url.rstrip('/') + '/api/ai-move'
+    # positions where black is to move next have an even number of stones;
+    # the server always plays white, so use odd-length move lists
+    positions = [pieces_for(random_moves(STAGES[stage] + 1)) for stage in STAGES]
+    out = []
+    for concurrency in CONCURRENCY:
+        n_requests = max(args.repeat, concurrency) * len(positions)
+        jobs = [positions[i % len(positions)] for i in range(n_requests)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(lambda job: post_move(url, job[1], 'bench-%d' % job[0]),
+                                      enumerate(jobs)))
+        elapsed = time.perf_counter() - start
+        out.append(result('api.ai_move', 'p50_latency', percentile(latencies, 50) * 1e3, 'ms',
+                          False, concurrency=concurrency))
+        out.append(result('api.ai_move', 'p95_latency', percentile(latencies, 95) * 1e3, 'ms',
+                          False, concurrency=concurrency))
+        out.append(result('api.ai_move', 'throughput', n_requests / elapsed, 'requests/s',
+                          True, concurrency=concurrency))
+    return out
@@ -0,0 +1,93 @@
+"""Self-play throughput of one game at a time (Game3D.start_self_play)
+against the batched lockstep engine at several concurrency levels, in
+games/sec, positions/sec and mean network batch size."""
+
+import time
+
+import numpy as np
+
+from alphazero.batched_selfplay import BatchedSelfPlay
+from alphazero.game_3d import Game3D
+from alphazero.mcts_alphaZero_3d import MCTSPlayer
+
+from .common import load_network, new_board, result, seed_everything, uniform_policy_value_fn
+
+CONCURRENCY = (1, 16, 64)
+N_PLAYOUT = 100
+
+
+class UniformBatchPolicy(object):
+    """Batched counterpart of uniform_policy_value_fn: uniform priors over the
+    empty cells and a zero value. Records the batch sizes it is called with.
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def policy_value(self, state_batch):
+        self.batch_sizes.append(len(state_batch))
+        empty = 1.0 - (state_batch[:, 0] + state_batch[:, 1]).reshape(len(state_batch), -1)
+        return empty / empty.sum(axis=1, keepdims=True), np.zeros((len(state_batch), 1))
+
+
+class RecordingNet(object):
+    """Wrap a PolicyValueNet3D to record its batch sizes"""
+
+    def __init__(self, net):
+        self.net = net
+        self.batch_sizes = []
+
+    def policy_value(self, state_batch):
+        self.batch_sizes.append(len(state_batch))
+        return self.net.policy_value(state_batch)
+
+
+def bench_sequential(policy_value_fn, n_games):
+    seed_everything()
+    game = Game3D(new_board())
+    player = MCTSPlayer(policy_value_fn, N_PLAYOUT, c_puct=5, is_selfplay=1, lazy_expansion=1)
+    n_positions = 0
+    start = time.perf_counter()
+    for _ in range(n_games):
+        _, data = game.start_self_play(player, temp=1.0)
+        n_positions += len(list(data))
+    return time.perf_counter() - start, n_positions
+
+
+def bench_batched(policy, n_concurrent, n_games):
+    seed_everything()
+    policy.batch_sizes = []
+    engine = BatchedSelfPlay(policy, n_playout=N_PLAYOUT, c_puct=5, temp=1.0,
+                             n_concurrent=n_concurrent)
+    n_positions = 0
+    start = time.perf_counter()
+    for _, _, data, _ in engine.play(n_games):
+        n_positions += len(data)
+    return time.perf_counter() - start, n_positions, float(np.mean(policy.batch_sizes))
+
+
+def run(args):
+    if args.policy == 'net':
+        net = load_network()
+        policy_value_fn, batch_policy = net.policy_value_fn, RecordingNet(net)
+    else:
+        policy_value_fn, batch_policy = uniform_policy_value_fn, UniformBatchPolicy()
+    n_games = args.games
+    out = []
+    elapsed, n_positions = bench_sequential(policy_value_fn, n_games)
+    params = dict(engine='sequential', games=n_games, n_playout=N_PLAYOUT, policy=args.policy)
+    out.append(result('batched.selfplay', 'games_per_second', n_games / elapsed, 'games/s', True,
+                      **params))
+    out.append(result('batched.selfplay', 'positions_per_second', n_positions / elapsed,
+                      'positions/s', True, **params))
+    for n_concurrent in CONCURRENCY:
+        elapsed, n_positions, mean_batch = bench_batched(batch_policy, n_concurrent, n_games)
+        params = dict(engine='batched', concurrent=n_concurrent, games=n_games,
+                      n_playout=N_PLAYOUT, policy=args.policy)
+        out.append(result('batched.selfplay', 'games_per_second', n_games / elapsed, 'games/s',
+                          True, **params))
+        out.append(result('batched.selfplay', 'positions_per_second', n_positions / elapsed,
+                          'positions/s', True, **params))
+        out.append(result('batched.selfplay', 'mean_batch_size', mean_batch, 'states', True,
+                          **params))
+    return out
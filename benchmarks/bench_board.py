@@ -0,0 +1,42 @@
+"""Throughput of the Board3D operations used on every playout. Each case
+is timed repeatedly after a warmup and reports the best rate."""
+
+import copy
+
+from .common import STAGES, best_rate, new_board, random_moves, result, stage_board
+
+OPS_PER_CALL = 500
+
+
+def bench_do_move(repeat, n_games=50):
+    games = [random_moves(STAGES['late'], seed) for seed in range(n_games)]
+    n_moves = sum(len(moves) for moves in games)
+
+    def play():
+        for moves in games:
+            board = new_board()
+            for move in moves:
+                board.do_move(move)
+    return result('board.do_move', 'throughput', best_rate(play, n_moves, repeat),
+                  'ops/s', True)
+
+
+def bench_stages(name, op, repeat):
+    out = []
+    for stage in STAGES:
+        board = stage_board(stage)
+
+        def run_op():
+            for _ in range(OPS_PER_CALL):
+                op(board)
+        out.append(result(name, 'throughput', best_rate(run_op, OPS_PER_CALL, repeat),
+                          'ops/s', True, stage=stage))
+    return out
+
+
+def run(args):
+    return ([bench_do_move(args.repeat)]
+            + bench_stages('board.game_end', lambda board: board.game_end(), args.repeat)
+            + bench_stages('board.current_state', lambda board: board.current_state(),
+                           args.repeat)
+            + bench_stages('board.deepcopy', copy.deepcopy, args.repeat))
@@ -0,0 +1,28 @@
+"""Latency of PolicyValueNet3D.predict by batch size, and of the value-only
+and policy-only paths. The predict workload lives in
+alphazero/inference_workload.py, shared with the thread tuner."""
+
+from alphazero.inference_workload import (WARMUP, latency_stats, time_predict,
+                                          workload_states)
+
+from .common import load_network, measure, percentile, result
+
+
+def run(args):
+    net = load_network()
+    out = []
+    for batch_size, states in workload_states():
+        stats = latency_stats(time_predict(net, states, args.repeat), batch_size)
+        out.append(result('net.predict', 'p50_latency', stats['p50_ms'], 'ms',
+                          False, batch_size=batch_size))
+        out.append(result('net.predict', 'p95_latency', stats['p95_ms'], 'ms',
+                          False, batch_size=batch_size))
+        out.append(result('net.predict', 'throughput', stats['throughput'], 'states/s',
+                          True, batch_size=batch_size))
+        for name, head in (('net.value_only', net.value_only), ('net.policy_only', net.policy_only)):
+            times = measure(lambda: head(states), repeat=args.repeat, warmup=WARMUP)
+            out.append(result(name, 'p50_latency', percentile(times, 50) * 1e3, 'ms',
+                              False, batch_size=batch_size))
+            out.append(result(name, 'p95_latency', percentile(times, 95) * 1e3, 'ms',
+                              False, batch_size=batch_size))
+    return out
@@ -0,0 +1,80 @@
+"""Eager (MCTS3D) versus lazy (LazyMCTS3D) child expansion: playouts/sec,
+selection time, nodes and bytes allocated, and whether both searches end
+with the same root visit counts."""
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from alphazero.mcts_alphaZero_3d import LazyMCTS3D, MCTS3D
+from alphazero.metrics import METRICS
+
+from .common import STAGES, SEED, result, stage_board, uniform_policy_value_fn
+
+N_PLAYOUTS = (200, 800)
+
+
+def random_prior_policy_value_fn(board):
+    """Deterministic non-uniform priors and value derived from the position"""
+    rng = np.random.RandomState((SEED + 7919 * len(board.availables) + board.last_move) % 2 ** 31)
+    probs = rng.rand(len(board.availables))
+    probs /= probs.sum()
+    return zip(board.availables, probs), float(rng.uniform(-0.5, 0.5))
+
+
+POLICIES = {'uniform': uniform_policy_value_fn, 'random-prior': random_prior_policy_value_fn}
+
+
+def run_search(mcts_cls, policy_value_fn, n_playout, stage):
+    board = stage_board(stage)
+    mcts = mcts_cls(policy_value_fn, n_playout, c_puct=4)
+    METRICS.reset()
+    start = time.perf_counter()
+    mcts.get_move_probs(board)
+    elapsed = time.perf_counter() - start
+    snapshot = METRICS.snapshot()
+    visits = dict(mcts._root.child_visits())
+
+    # allocation is measured on a separate run as tracemalloc slows the search
+    mcts = mcts_cls(policy_value_fn, n_playout, c_puct=4)
+    tracemalloc.start()
+    mcts.get_move_probs(board)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'playouts_per_second': n_playout / elapsed,
+        'select_seconds': snapshot['timers']['mcts_phase_seconds{phase="select"}']['seconds'],
+        'nodes': snapshot['counters'].get('mcts_nodes_allocated_total', 0),
+        'peak_bytes': peak,
+        'visits': {act: n for act, n in visits.items() if n > 0},
+    }
+
+
+def run(args):
+    was_enabled = METRICS.enabled
+    METRICS.enable()
+    out = []
+    try:
+        for policy_name, policy_value_fn in POLICIES.items():
+            for n_playout in N_PLAYOUTS:
+                for stage in STAGES:
+                    eager = run_search(MCTS3D, policy_value_fn, n_playout, stage)
+                    lazy = run_search(LazyMCTS3D, policy_value_fn, n_playout, stage)
+                    params = dict(n_playout=n_playout, stage=stage, policy=policy_name)
+                    for variant, res in (('eager', eager), ('lazy', lazy)):
+                        out.append(result('lazy.search', 'playouts_per_second',
+                                          res['playouts_per_second'], 'playouts/s', True,
+                                          variant=variant, **params))
+                        out.append(result('lazy.search', 'select_ms', res['select_seconds'] * 1e3,
+                                          'ms', False, variant=variant, **params))
+                        out.append(result('lazy.search', 'nodes_allocated', res['nodes'],
+                                          'nodes', False, variant=variant, **params))
+                        out.append(result('lazy.search', 'peak_bytes', res['peak_bytes'],
+                                          'bytes', False, variant=variant, **params))
+                    out.append(result('lazy.search', 'same_visits',
+                                      float(eager['visits'] == lazy['visits']), 'bool', True,
+                                      **params))
+    finally:
+        METRICS.enabled = was_enabled
+    return out
@@ -0,0 +1,45 @@
+"""Playouts per second of MCTS3D at different search sizes and game stages,
+from the fastest of repeated searches on fresh trees."""
+
+from alphazero.mcts_alphaZero_3d import MCTS3D
+from alphazero.metrics import METRICS
+
+from .common import (STAGES, best_rate, load_network, result, seed_everything, stage_board,
+                     uniform_policy_value_fn)
+
+N_PLAYOUTS = (50, 200, 800)
+
+
+def policy_for(args):
+    if args.policy == 'net':
+        return load_network().policy_value_fn
+    return uniform_policy_value_fn
+
+
+def bench_search(policy_value_fn, n_playout, stage, policy_name, repeat):
+    board = stage_board(stage)
+
+    def search():
+        seed_everything()
+        MCTS3D(policy_value_fn, n_playout, c_puct=4).get_move_probs(board, temp=1e-3)
+
+    search()  # warmup, kept out of the phase timers
+    METRICS.reset()
+    rate = best_rate(search, n_playout, repeat, warmup=0)
+    params = dict(n_playout=n_playout, stage=stage, policy=policy_name)
+    out = result('mcts.search', 'playouts_per_second', rate, 'playouts/s', True, **params)
+    out['phases'] = METRICS.snapshot()['timers']
+    return out
+
+
+def run(args):
+    policy_value_fn = policy_for(args)
+    was_enabled = METRICS.enabled
+    METRICS.enable()
+    try:
+        # searches are slow, so fewer repetitions than the latency benchmarks
+        repeat = max(3, args.repeat // 4)
+        return [bench_search(policy_value_fn, n_playout, stage, args.policy, repeat)
+                for n_playout in N_PLAYOUTS for stage in STAGES]
+    finally:
+        METRICS.enabled = was_enabled
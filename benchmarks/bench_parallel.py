@@ -0,0 +1,83 @@
+"""Speedup of root-parallel MCTS at 1, 2, 4 and 8 workers, in playouts/sec
+and in playing strength against a single-worker search."""
+
+import time
+
+from alphazero.game_3d import Game3D
+from alphazero.mcts_alphaZero_3d import MCTSPlayer
+from alphazero.mcts_parallel import NetPolicyFactory, ParallelMCTSPlayer, RootParallelMCTS
+
+from .common import MODEL_PATH, load_network, new_board, result, seed_everything, stage_board, uniform_policy_value_fn
+
+WORKERS = (1, 2, 4, 8)
+N_PLAYOUT = 800
+
+
+def uniform_policy_factory():
+    return uniform_policy_value_fn
+
+
+def policy_args(args):
+    """Return (policy_value_fn, picklable factory) for the chosen policy"""
+    if args.policy == 'net':
+        return load_network().policy_value_fn, NetPolicyFactory(MODEL_PATH)
+    return uniform_policy_value_fn, uniform_policy_factory
+
+
+def bench_throughput(policy_value_fn, factory, n_workers, backend, stage, args):
+    seed_everything()
+    board = stage_board(stage)
+    mcts = RootParallelMCTS(policy_value_fn, N_PLAYOUT, c_puct=4, n_workers=n_workers,
+                            backend=backend, policy_factory=factory, seed=0)
+    try:
+        mcts.search(board)  # start the workers outside the timed call
+        start = time.perf_counter()
+        mcts.search(board)
+        elapsed = time.perf_counter() - start
+    finally:
+        mcts.close()
+    return N_PLAYOUT / elapsed
+
+
+def bench_strength(policy_value_fn, factory, n_workers, backend, args, base_playout=100):
+    """Win rate of an n-worker search given n times the playouts of a
+    single-worker opponent, i.e. the same wall-clock budget at perfect
+    speedup. Draws count as half a win.
+    """
+    seed_everything()
+    parallel = ParallelMCTSPlayer(policy_value_fn, base_playout * n_workers, c_puct=4,
+                                  n_workers=n_workers, backend=backend, policy_factory=factory)
+    single = MCTSPlayer(policy_value_fn, base_playout, c_puct=4)
+    game = Game3D(new_board())
+    score = 0.0
+    try:
+        for i in range(args.games):
+            winner = game.start_play(parallel, single, start_player=i % 2, is_shown=0)
+            if winner == -1:
+                score += 0.5
+            elif winner == parallel.player:
+                score += 1.0
+    finally:
+        parallel.close()
+    return score / args.games
+
+
+def run(args):
+    policy_value_fn, factory = policy_args(args)
+    out = []
+    for backend in ('process', 'thread'):
+        for stage in ('opening', 'middle'):
+            base = None
+            for n_workers in WORKERS:
+                pps = bench_throughput(policy_value_fn, factory, n_workers, backend, stage, args)
+                base = base or pps
+                params = dict(workers=n_workers, backend=backend, stage=stage, policy=args.policy)
+                out.append(result('parallel.search', 'playouts_per_second', pps, 'playouts/s',
+                                  True, **params))
+                out.append(result('parallel.search', 'speedup', pps / base, 'x', True, **params))
+    if args.games > 0:
+        for n_workers in WORKERS[1:]:
+            win_rate = bench_strength(policy_value_fn, factory, n_workers, 'process', args)
+            out.append(result('parallel.strength', 'win_rate', win_rate, 'fraction', True,
+                              workers=n_workers, games=args.games, policy=args.policy))
+    return out
@@ -0,0 +1,26 @@
+"""Rollout throughput of the pure MCTS player, from the fastest of repeated
+timed batches of rollouts."""
+
+import copy
+
+from alphazero.mcts_pure import MCTS, policy_value_fn
+
+from .common import STAGES, best_rate, result, seed_everything, stage_board
+
+ROLLOUTS_PER_CALL = 50
+
+
+def run(args):
+    out = []
+    for stage in STAGES:
+        board = stage_board(stage)
+        mcts = MCTS(policy_value_fn)
+
+        def rollouts():
+            seed_everything()
+            for _ in range(ROLLOUTS_PER_CALL):
+                mcts._evaluate_rollout(copy.deepcopy(board))
+        out.append(result('pure.rollout', 'throughput',
+                          best_rate(rollouts, ROLLOUTS_PER_CALL, args.repeat),
+                          'rollouts/s', True, stage=stage))
+    return out
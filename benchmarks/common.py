@@ -0,0 +1,111 @@
+"""
+Shared helpers for the benchmark suite: seeding, timing, fixed positions and
+the result record format.
+"""
+
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from alphazero.game_3d import Board3D  # noqa: E402
+
+GRID_SIZE = 4
+N_IN_ROW = 4
+SEED = 1234
+MODEL_PATH = os.path.join(ROOT, 'alphazero/policy_3d_iter_100_2nd.weights.h5')
+
+# number of stones already on the board for each game stage
+STAGES = {'opening': 0, 'middle': 16, 'late': 32}
+
+
+def seed_everything(seed=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def new_board():
+    board = Board3D(width=GRID_SIZE, height=GRID_SIZE, depth=GRID_SIZE, n_in_row=N_IN_ROW)
+    board.init_board(0)
+    return board
+
+
+def random_moves(n_moves, seed=SEED):
+    """Return a fixed sequence of n_moves random moves that does not end the game"""
+    rng = np.random.RandomState(seed)
+    while True:
+        board = new_board()
+        moves = []
+        for _ in range(n_moves):
+            move = int(rng.choice(board.availables))
+            board.do_move(move)
+            moves.append(move)
+            if board.game_end()[0]:
+                break
+        else:
+            return moves
+
+
+def stage_board(stage, seed=SEED):
+    board = new_board()
+    for move in random_moves(STAGES[stage], seed):
+        board.do_move(move)
+    return board
+
+
+def measure(fn, repeat, warmup=1):
+    """Call fn() warmup + repeat times and return the per-call seconds of the
+    timed calls
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def percentile(values, q):
+    return float(np.percentile(np.asarray(values), q))
+
+
+def best_rate(fn, n_ops, repeat, warmup=1):
+    """Operations per second of fn() doing n_ops operations, from the fastest
+    of repeat timed calls after warmup calls. The fastest call is the one
+    least disturbed by other load on the machine.
+    """
+    return n_ops / min(measure(fn, repeat, warmup))
+
+
+def result(name, metric, value, unit, higher_is_better, **params):
+    """A single benchmark measurement as stored in the results JSON"""
+    return {
+        'name': name,
+        'params': params,
+        'metric': metric,
+        'value': float(value),
+        'unit': unit,
+        'higher_is_better': higher_is_better,
+    }
+
+
+def uniform_policy_value_fn(board):
+    """Network-free policy: uniform priors and a zero value"""
+    action_probs = np.ones(len(board.availables)) / len(board.availables)
+    return zip(board.availables, action_probs), 0.0
+
+
+def load_network(seed=SEED):
+    """Build PolicyValueNet3D with fixed initial weights, loading the trained
+    weights when they are present
+    """
+    from alphazero.inference_workload import load_network as load_workload_network
+    return load_workload_network(MODEL_PATH, seed)
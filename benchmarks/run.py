@@ -0,0 +1,116 @@
+"""
+Run the benchmark suite and optionally compare against a stored baseline.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --suite board mcts --compare baseline.json
+    python -m benchmarks.run --suite api --url http://localhost:3002
+
+A benchmark regresses when it is worse than the baseline by more than
+--threshold (relative); the exit status is 1 if any benchmark regressed.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from .common import SEED, seed_everything
+from . import bench_api, bench_batched, bench_board, bench_inference, bench_lazy, bench_mcts, bench_parallel, bench_pure
+
+SUITES = {
+    'board': bench_board,
+    'mcts': bench_mcts,
+    'inference': bench_inference,
+    'pure': bench_pure,
+    'parallel': bench_parallel,
+    'lazy': bench_lazy,
+    'batched': bench_batched,
+    'api': bench_api,
+}
+DEFAULT_SUITES = ('board', 'mcts', 'pure')
+
+
+def result_key(entry):
+    return (entry['name'], entry['metric'], json.dumps(entry['params'], sort_keys=True))
+
+
+def compare(results, baseline, threshold):
+    """Return a list of (entry, baseline value, relative change) for every
+    benchmark that got worse than the baseline by more than threshold
+    """
+    previous = {result_key(entry): entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = previous.get(result_key(entry))
+        if old is None or old['value'] == 0:
+            continue
+        change = (entry['value'] - old['value']) / old['value']
+        worse = -change if entry['higher_is_better'] else change
+        if worse > threshold:
+            regressions.append((entry, old['value'], change))
+    return regressions
+
+
+def format_entry(entry):
+    params = ', '.join('{}={}'.format(k, v) for k, v in sorted(entry['params'].items()))
+    return '{} [{}] {}'.format(entry['name'], params, entry['metric'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='3D Gomoku benchmark suite')
+    parser.add_argument('--suite', nargs='+', choices=sorted(SUITES), default=list(DEFAULT_SUITES))
+    parser.add_argument('--policy', choices=('uniform', 'net'), default='uniform',
+                        help='policy used by the MCTS benchmarks')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='timed repetitions for latency benchmarks')
+    parser.add_argument('--games', type=int, default=10,
+                        help='games per worker count in the parallel strength benchmark '
+                             'and per engine in the batched self-play benchmark')
+    parser.add_argument('--url', help='base URL of a running API server for the api suite')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    seed_everything()
+    results = []
+    for name in args.suite:
+        start = time.perf_counter()
+        suite_results = SUITES[name].run(args)
+        print('{}: {} results in {:.1f}s'.format(name, len(suite_results),
+                                                 time.perf_counter() - start))
+        for entry in suite_results:
+            print('  {}: {:.2f} {}'.format(format_entry(entry), entry['value'], entry['unit']))
+        results.extend(suite_results)
+
+    report = {
+        'seed': SEED,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'suites': args.suite,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Results written to', args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for entry, old, change in regressions:
+            print('REGRESSION {}: {:.2f} -> {:.2f} {} ({:+.1%})'.format(
+                format_entry(entry), old, entry['value'], entry['unit'], change))
+        if regressions:
+            return 1
+        print('No regressions against', args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -22,6 +22,8 @@ interface GameProps {
 
 interface AIResponse {
   move: Position;
+  moveIndex?: number;
+  moveCount?: number;
   source: 'alphazero';
   error?: string;
 }
@@ -285,7 +287,11 @@ const Game: React.FC<GameProps> = ({
                 'Content-Type': 'application/json',
               },
               body: JSON.stringify({ 
-                pieces,
+                protocol: 2,
+                // Ordered move indices (z * 16 + y * 4 + x), black first
+                moves: pieces.map(p => 
+                  p.position.z * GRID_SIZE * GRID_SIZE + p.position.y * GRID_SIZE + p.position.x
+                ),
                 requestId: Date.now(), // Add request ID for tracking
               }),
             }),
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from alphazero.game_3d import Board3D
+
+
+def _uniform_policy_value_fn(board):
+    action_probs = np.ones(len(board.availables)) / len(board.availables)
+    return zip(board.availables, action_probs), 0.0
+
+
+def _uniform_policy_factory():
+    return _uniform_policy_value_fn
+
+
+@pytest.fixture
+def uniform_policy_factory():
+    """Picklable factory of the uniform policy, for worker processes"""
+    return _uniform_policy_factory
+
+
+@pytest.fixture
+def uniform_policy_value_fn():
+    """Policy-value function with uniform priors and a value of 0"""
+    return _uniform_policy_value_fn
+
+
+@pytest.fixture
+def new_board():
+    """Factory of empty 4x4x4 boards"""
+    def make():
+        board = Board3D(width=4, height=4, depth=4, n_in_row=4)
+        board.init_board()
+        return board
+    return make
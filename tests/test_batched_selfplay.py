@@ -0,0 +1,70 @@
+import copy
+
+import numpy as np
+
+from alphazero.batched_selfplay import BatchedSelfPlay, BoardBatch
+
+
+def random_positions(new_board, n_games=30, seed=0):
+    """Boards and their move lists at every ply of random games"""
+    rng = np.random.RandomState(seed)
+    positions = []
+    for _ in range(n_games):
+        board = new_board()
+        moves = []
+        positions.append((board, list(moves)))
+        while not board.game_end()[0]:
+            move = int(rng.choice(board.availables))
+            board = copy.deepcopy(board)
+            board.do_move(move)
+            moves.append(move)
+            positions.append((board, list(moves)))
+    return positions
+
+
+def batch_of(positions):
+    batch = BoardBatch(len(positions))
+    for g, (_, moves) in enumerate(positions):
+        for move in moves:
+            batch.do_move(g, move)
+    return batch
+
+
+def test_winners_match_game_end(new_board):
+    positions = random_positions(new_board)
+    batch = batch_of(positions)
+    winners = batch.winners(batch.stones)
+    for (board, _), winner in zip(positions, winners):
+        end, board_winner = board.game_end()
+        assert winner == (board_winner if end else 0)
+
+
+def test_full_board_without_line_is_a_tie():
+    # a drawn game of tic-tac-toe; Board3D does not allow a board this flat
+    batch = BoardBatch(1, width=3, height=3, depth=1, n_in_row=3)
+    for move in [0, 1, 2, 4, 3, 5, 7, 6, 8]:
+        batch.do_move(0, move)
+    assert batch.winners(batch.stones)[0] == -1
+
+
+def test_states_match_current_state(new_board):
+    positions = random_positions(new_board, n_games=5)
+    batch = batch_of(positions)
+    states = batch.states(batch.stones, batch.last_move, batch.n_moves)
+    for (board, _), state in zip(positions, states):
+        np.testing.assert_array_equal(state, board.current_state())
+
+
+class UniformNet(object):
+    def policy_value(self, states):
+        n = len(states)
+        return np.full((n, 64), 1.0 / 64), np.zeros((n, 1))
+
+
+def test_play_finishes_every_game():
+    engine = BatchedSelfPlay(UniformNet(), n_playout=20, n_concurrent=3, leaves_per_game=2)
+    results = list(engine.play(5, first_game_id=10))
+    assert sorted(game_id for game_id, _, _, _ in results) == list(range(10, 15))
+    for game_id, winner, play_data, record in results:
+        assert record.game_id == game_id and record.winner == winner
+        assert len(play_data) == len(record.moves)
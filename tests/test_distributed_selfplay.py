@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from alphazero import distributed_selfplay
+from alphazero.distributed_selfplay import SelfPlayCoordinator, pack_records
+from alphazero.game_record import GameRecord, GameRecordReader
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(distributed_selfplay, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def coordinator(tmp_path, clock):
+    coordinator = SelfPlayCoordinator(str(tmp_path / 'games.gmr'), n_games=4,
+                                      games_per_lease=2, lease_timeout=60)
+    yield coordinator
+    coordinator.close()
+
+
+def records(game_ids):
+    return pack_records([GameRecord(game_id, [0, 1], np.ones((2, 64)), 1)
+                         for game_id in game_ids])
+
+
+def test_leases_hand_out_each_game_once(coordinator):
+    worker = coordinator.register('w')
+    first = coordinator.lease(worker)
+    second = coordinator.lease(worker)
+    assert first['gameIds'] == [0, 1]
+    assert second['gameIds'] == [2, 3]
+    assert coordinator.lease(worker) == {'gameIds': [], 'retryAfter': 1.0}
+
+
+def test_expired_lease_is_requeued(coordinator, clock):
+    dead, alive = coordinator.register('dead'), coordinator.register('alive')
+    lost = coordinator.lease(dead)
+    clock.now += 61
+    assert coordinator.lease(alive)['gameIds'] == lost['gameIds']
+    assert coordinator.status()['leases'] == 1
+
+
+def test_heartbeat_extends_lease(coordinator, clock):
+    worker = coordinator.register('w')
+    lease = coordinator.lease(worker)
+    clock.now += 50
+    assert coordinator.heartbeat(lease['leaseId'])
+    clock.now += 50
+    assert coordinator.lease(worker)['gameIds'] == [2, 3]
+    assert not coordinator.heartbeat('unknown')
+
+
+def test_duplicate_submits_are_dropped(coordinator, clock, tmp_path):
+    slow, fast = coordinator.register('slow'), coordinator.register('fast')
+    stale = coordinator.lease(slow)
+    clock.now += 61
+    fresh = coordinator.lease(fast)
+    assert coordinator.submit(fresh['leaseId'], records(fresh['gameIds'])) == 2
+    # the expired lease comes back late with the same games
+    assert coordinator.submit(stale['leaseId'], records(stale['gameIds'])) == 0
+    with GameRecordReader(str(tmp_path / 'games.gmr')) as reader:
+        assert [record.game_id for record in reader] == [0, 1]
+
+
+def test_partial_submit_requeues_missing_games(coordinator):
+    worker = coordinator.register('w')
+    lease = coordinator.lease(worker)
+    assert coordinator.submit(lease['leaseId'], records(lease['gameIds'][:1])) == 1
+    assert coordinator.lease(worker)['gameIds'] == [1, 2]
+
+
+def test_finished_after_all_games(coordinator):
+    worker = coordinator.register('w')
+    for _ in range(2):
+        lease = coordinator.lease(worker)
+        coordinator.submit(lease['leaseId'], records(lease['gameIds']))
+    assert coordinator.finished.is_set()
+    assert coordinator.lease(worker) == {'done': True}
@@ -0,0 +1,97 @@
+import numpy as np
+
+from alphazero.game_3d import Adjudicator, Board3D, winning_lines
+
+
+def test_winning_lines_of_4x4x4_board():
+    lines = winning_lines(4, 4, 4, 4)
+    assert lines.shape == (76, 4)
+    assert len({tuple(sorted(line)) for line in lines.tolist()}) == 76
+
+
+def test_winning_lines_agree_with_has_a_winner():
+    lines = winning_lines(4, 4, 4, 4)
+    rng = np.random.RandomState(0)
+    for _ in range(200):
+        board = Board3D(width=4, height=4, depth=4, n_in_row=4)
+        board.init_board()
+        stones = np.zeros(64, dtype=np.int8)
+        for move in rng.permutation(64)[:rng.randint(0, 64)]:
+            if board.game_end()[0]:
+                break
+            stones[move] = board.get_current_player()
+            board.do_move(int(move))
+        win, winner = board.has_a_winner()
+        line_winners = [p for p in (1, 2) if (stones[lines] == p).all(axis=1).any()]
+        assert line_winners == ([winner] if win else [])
+
+
+def play_observed(adjudicator, board, values_by_move):
+    """Observe values before each move, playing moves 0, 1, 2, ...;
+    returns the first decision and the number of moves played
+    """
+    for n, values in enumerate(values_by_move):
+        decision = adjudicator.observe(board, values)
+        if decision is not None:
+            return decision, n
+        board.do_move(n)
+    return None, len(values_by_move)
+
+
+def test_resigns_after_consecutive_low_values(new_board):
+    adjudicator = Adjudicator(resign_threshold=-0.9, resign_consecutive=3, resign_min_moves=0,
+                              resign_check_fraction=0)
+    adjudicator.new_game()
+    # player 1 moves on even plies and is losing from the start
+    values = [[-0.95], [0.95]] * 5
+    assert play_observed(adjudicator, new_board(), values) == (2, 4)
+    assert adjudicator.stats['resigned'] == 1
+
+
+def test_resignation_streak_resets(new_board):
+    adjudicator = Adjudicator(resign_threshold=-0.9, resign_consecutive=2, resign_min_moves=0,
+                              resign_check_fraction=0)
+    adjudicator.new_game()
+    # player 1 recovers on ply 2, so its streak only reaches 2 on ply 6
+    values = [[-0.95], [0], [-0.5], [0], [-0.95], [0], [-0.95], [0]]
+    assert play_observed(adjudicator, new_board(), values) == (2, 6)
+
+
+def test_no_resignation_before_min_moves(new_board):
+    adjudicator = Adjudicator(resign_threshold=-0.9, resign_consecutive=1, resign_min_moves=5,
+                              resign_check_fraction=0)
+    adjudicator.new_game()
+    # player 2 moves on odd plies
+    values = [[0], [-0.95]] * 4
+    assert play_observed(adjudicator, new_board(), values) == (1, 5)
+
+
+def test_value_estimate_can_veto_resignation(new_board):
+    adjudicator = Adjudicator(resign_threshold=-0.9, resign_consecutive=1, resign_min_moves=0,
+                              resign_check_fraction=0)
+    adjudicator.new_game()
+    assert play_observed(adjudicator, new_board(), [[-0.95, 0.2]] * 4) == (None, 4)
+
+
+def test_draw_after_quiet_moves(new_board):
+    adjudicator = Adjudicator(draw_threshold=0.05, draw_consecutive=4, draw_min_moves=0,
+                              resign_check_fraction=0)
+    adjudicator.new_game()
+    values = [[0.01], [0.3], [0.0], [-0.02], [0.04], [0.01], [0.0]]
+    assert play_observed(adjudicator, new_board(), values) == (-1, 5)
+    assert adjudicator.stats['drawn'] == 1
+
+
+def test_checked_resignation_is_scored(new_board):
+    adjudicator = Adjudicator(resign_threshold=-0.9, resign_consecutive=1, resign_min_moves=0,
+                              resign_check_fraction=1.0)
+    adjudicator.new_game()
+    assert play_observed(adjudicator, new_board(), [[-0.95]] * 6) == (None, 6)
+    adjudicator.finish(winner=1)  # the player who wanted to resign won
+    assert adjudicator.stats['resign_checked'] == 1
+    assert adjudicator.false_resignation_rate() == 1.0
+
+
+def test_players_without_search_give_no_values(new_board):
+    adjudicator = Adjudicator(resign_threshold=-0.9)
+    assert adjudicator.position_values(new_board(), object()) == []
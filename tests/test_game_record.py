@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from alphazero.game_record import (GameRecord, GameRecordReader, GameRecordWriter,
+                                   record_to_training_data)
+
+
+def random_record(game_id, n_moves=20, seed=0):
+    rng = np.random.RandomState(seed)
+    moves = rng.permutation(64)[:n_moves]
+    visits = rng.randint(0, 1000, size=(n_moves, 64)).astype(np.uint16)
+    empty = np.ones(64, dtype=bool)
+    for move, row in zip(moves, visits):
+        row[~empty] = 0  # only cells still empty are searched
+        empty[move] = False
+    return GameRecord(game_id, moves, visits, winner=1 + game_id % 2,
+                      model_id='model-{}'.format(game_id), temp=0.5)
+
+
+def assert_same_record(a, b):
+    assert a.game_id == b.game_id
+    assert a.winner == b.winner
+    assert a.model_id == b.model_id
+    assert a.temp == b.temp
+    assert (a.width, a.height, a.depth, a.n_in_row) == (b.width, b.height, b.depth, b.n_in_row)
+    np.testing.assert_array_equal(a.moves, b.moves)
+    np.testing.assert_array_equal(a.visits, b.visits)
+
+
+def test_bytes_round_trip():
+    record = random_record(7)
+    assert_same_record(GameRecord.from_bytes(record.to_bytes()), record)
+
+
+def test_reader_streams_and_indexes_records(tmp_path):
+    path = str(tmp_path / 'games.gmr')
+    records = [random_record(game_id, seed=game_id) for game_id in range(5)]
+    with GameRecordWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+    with GameRecordReader(path) as reader:
+        for read, record in zip(reader, records):
+            assert_same_record(read, record)
+        assert len(reader) == 5
+        assert sorted(reader.game_ids()) == list(range(5))
+        assert_same_record(reader.get(3), records[3])
+        assert_same_record(reader.get(0), records[0])
+
+
+def test_training_data_replays_moves():
+    record = random_record(1)
+    data = record_to_training_data(record)
+    assert len(data) == len(record.moves)
+    for state, mcts_probs, z in data:
+        assert state.shape == (4, 4, 4, 4)
+        assert np.isclose(mcts_probs.sum(), 1.0)
+        assert z in (1.0, -1.0)
+
+
+def test_boards_over_256_cells_are_rejected():
+    with pytest.raises(ValueError):
+        GameRecord(0, [], np.zeros((0, 343)), 1, width=7, height=7, depth=7)
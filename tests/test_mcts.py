@@ -0,0 +1,34 @@
+import pytest
+
+from alphazero.mcts_alphaZero_3d import MCTSPlayer
+from alphazero.node_pool import PROCESS_BUDGET
+
+
+@pytest.mark.parametrize('lazy_expansion', [0, 1])
+def test_single_playout_search(lazy_expansion, uniform_policy_value_fn, new_board):
+    player = MCTSPlayer(uniform_policy_value_fn, n_playout=1, lazy_expansion=lazy_expansion)
+    board = new_board()
+    assert player.get_action(board) in board.availables
+    assert player.mcts.last_value is None
+
+
+@pytest.mark.parametrize('lazy_expansion', [0, 1])
+def test_last_value_is_root_q_of_most_visited_move(lazy_expansion, uniform_policy_value_fn,
+                                                   new_board):
+    player = MCTSPlayer(uniform_policy_value_fn, n_playout=50, lazy_expansion=lazy_expansion)
+    board = new_board()
+    acts, _ = player.mcts.get_move_probs(board)
+    visits = player.mcts.last_visits
+    best = max(visits, key=visits.get)
+    assert player.mcts.last_value == player.mcts._root._children[best]._Q
+
+
+def test_lazy_tree_rejects_node_cap(uniform_policy_value_fn):
+    with pytest.raises(ValueError):
+        MCTSPlayer(uniform_policy_value_fn, n_playout=10, max_nodes=100, lazy_expansion=1)
+
+
+def test_lazy_tree_rejects_process_budget(monkeypatch, uniform_policy_value_fn):
+    monkeypatch.setattr(PROCESS_BUDGET, 'max_nodes', 100)
+    with pytest.raises(ValueError):
+        MCTSPlayer(uniform_policy_value_fn, n_playout=10, lazy_expansion=1)
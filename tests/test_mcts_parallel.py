@@ -0,0 +1,45 @@
+import pytest
+
+from alphazero.mcts_parallel import RootParallelMCTS, root_visits
+
+
+def expected_visits(policy_value_fn, board, n_playout, n_workers, seed):
+    """Sum of the root visits of the worker searches, run one after another"""
+    mcts = RootParallelMCTS(policy_value_fn, n_playout, c_puct=5, n_workers=n_workers, seed=seed)
+    visits = {}
+    for task in mcts._tasks(board):
+        for act, n in root_visits(policy_value_fn, *task).items():
+            visits[act] = visits.get(act, 0) + n
+    return visits
+
+
+@pytest.mark.parametrize('n_workers', [1, 2, 3])
+def test_thread_workers_merge_root_visits(n_workers, uniform_policy_value_fn, new_board):
+    board = new_board()
+    mcts = RootParallelMCTS(uniform_policy_value_fn, 100, c_puct=5, n_workers=n_workers, seed=7)
+    try:
+        visits = mcts.search(board)
+    finally:
+        mcts.close()
+    # the first playout of every tree only expands its root
+    assert sum(visits.values()) == 100 - n_workers
+    assert visits == expected_visits(uniform_policy_value_fn, board, 100, n_workers, seed=7)
+    assert mcts.last_visits == visits
+
+
+def test_process_workers_merge_root_visits(uniform_policy_value_fn, uniform_policy_factory,
+                                           new_board):
+    board = new_board()
+    mcts = RootParallelMCTS(uniform_policy_value_fn, 60, c_puct=5, n_workers=2,
+                            backend='process', policy_factory=uniform_policy_factory, seed=7)
+    try:
+        visits = mcts.search(board)
+    finally:
+        mcts.close()
+    assert sum(visits.values()) == 58
+    assert visits == expected_visits(uniform_policy_value_fn, board, 60, 2, seed=7)
+
+
+def test_process_backend_needs_factory(uniform_policy_value_fn):
+    with pytest.raises(ValueError):
+        RootParallelMCTS(uniform_policy_value_fn, 10, backend='process')
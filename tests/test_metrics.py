@@ -0,0 +1,60 @@
+from alphazero.metrics import Metrics
+
+
+def test_disabled_registry_records_nothing():
+    metrics = Metrics()
+    metrics.inc('requests_total')
+    metrics.observe('network_batch_size', 8)
+    with metrics.timer('network_seconds'):
+        pass
+    assert metrics.render_prometheus() == '\n'
+
+
+def test_render_prometheus_counters_and_gauges():
+    metrics = Metrics(enabled=True)
+    metrics.inc('api_requests_total', endpoint='move', status='ok')
+    metrics.inc('api_requests_total', 2, status='ok', endpoint='move')
+    metrics.inc('api_requests_total', endpoint='analyze', status='error')
+    metrics.set_gauge('mcts_resident_nodes', 42)
+    lines = metrics.render_prometheus().splitlines()
+    assert lines == [
+        '# TYPE gomoku_api_requests_total counter',
+        'gomoku_api_requests_total{endpoint="analyze",status="error"} 1',
+        'gomoku_api_requests_total{endpoint="move",status="ok"} 3',
+        '# TYPE gomoku_mcts_resident_nodes gauge',
+        'gomoku_mcts_resident_nodes 42',
+    ]
+
+
+def test_render_prometheus_timers_as_summaries():
+    metrics = Metrics(enabled=True, prefix='test_')
+    metrics.observe_time('mcts_phase_seconds', 0.25, phase='select')
+    metrics.observe_time('mcts_phase_seconds', 0.5, phase='select')
+    lines = metrics.render_prometheus().splitlines()
+    assert lines == [
+        '# TYPE test_mcts_phase_seconds summary',
+        'test_mcts_phase_seconds_count{phase="select"} 2',
+        'test_mcts_phase_seconds_sum{phase="select"} 0.750000000',
+    ]
+
+
+def test_render_prometheus_histogram_buckets_are_cumulative():
+    metrics = Metrics(enabled=True)
+    for value in (1, 3, 3, 100):
+        metrics.observe('network_batch_size', value, buckets=(1, 4, 16))
+    lines = metrics.render_prometheus().splitlines()
+    assert lines == [
+        '# TYPE gomoku_network_batch_size histogram',
+        'gomoku_network_batch_size_bucket{le="1"} 1',
+        'gomoku_network_batch_size_bucket{le="4"} 3',
+        'gomoku_network_batch_size_bucket{le="16"} 3',
+        'gomoku_network_batch_size_bucket{le="+Inf"} 4',
+        'gomoku_network_batch_size_count 4',
+        'gomoku_network_batch_size_sum 107',
+    ]
+
+
+def test_snapshot_keys_include_labels():
+    metrics = Metrics(enabled=True)
+    metrics.inc('ponder_total', result='hit')
+    assert metrics.snapshot()['counters'] == {'ponder_total{result="hit"}': 1}
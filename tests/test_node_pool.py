@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from alphazero.mcts_alphaZero_3d import MCTS3D
+from alphazero.node_pool import PROCESS_BUDGET
+
+
+@pytest.fixture
+def process_budget(monkeypatch):
+    monkeypatch.setattr(PROCESS_BUDGET, 'max_nodes', 100)
+    return PROCESS_BUDGET
+
+
+def test_search_in_tree_starved_by_process_budget(process_budget, uniform_policy_value_fn,
+                                                  new_board):
+    first = MCTS3D(uniform_policy_value_fn, 400)
+    first.get_move_probs(new_board())
+    assert process_budget.headroom() < 64
+
+    second = MCTS3D(uniform_policy_value_fn, 50)
+    acts, probs = second.get_move_probs(new_board())
+    assert len(acts) == 64
+    assert np.isclose(np.sum(probs), 1.0)
+    assert sum(second.last_visits.values()) == 49
+
+
+@pytest.mark.parametrize('max_nodes', [1, 10, 63])
+def test_search_with_cap_below_legal_moves(max_nodes, uniform_policy_value_fn, new_board):
+    mcts = MCTS3D(uniform_policy_value_fn, 50, max_nodes=max_nodes)
+    acts, probs = mcts.get_move_probs(new_board())
+    assert len(acts) == 64
+    assert np.isclose(np.sum(probs), 1.0)
+    # only the root was expanded
+    assert mcts.memory_stats()['resident_nodes'] == 65
+
+
+def test_cap_is_respected_after_root(uniform_policy_value_fn, new_board):
+    mcts = MCTS3D(uniform_policy_value_fn, 400, max_nodes=500)
+    mcts.get_move_probs(new_board())
+    assert mcts.memory_stats()['resident_nodes'] <= 500
+
+
+def test_released_tree_returns_budget(process_budget, uniform_policy_value_fn, new_board):
+    resident = process_budget.resident
+    mcts = MCTS3D(uniform_policy_value_fn, 100)
+    mcts.get_move_probs(new_board())
+    assert process_budget.resident > resident
+    mcts.update_with_move(-1)
+    del mcts
+    assert process_budget.resident == resident
+
+
+def test_free_lists_count_against_process_budget(monkeypatch, uniform_policy_value_fn,
+                                                 new_board):
+    monkeypatch.setattr(PROCESS_BUDGET, 'max_nodes', PROCESS_BUDGET.resident
+                        + PROCESS_BUDGET.free + 1000)
+    trees = []
+    for _ in range(5):
+        mcts = MCTS3D(uniform_policy_value_fn, 200)
+        trees.append(mcts)
+        for _ in range(2):
+            mcts.get_move_probs(new_board())
+            assert PROCESS_BUDGET.headroom() >= 0
+            mcts.update_with_move(-1)
+            assert PROCESS_BUDGET.headroom() >= 0
+    held = sum(t._pool.resident_nodes + t._pool.free_nodes for t in trees)
+    assert held <= 1000
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from alphazero.policy_value_net_tf2_3d import PolicyValueNet3D  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def net():
+    tf.random.set_seed(0)
+    return PolicyValueNet3D(4, 4, 4)
+
+
+@pytest.fixture(scope='module')
+def states():
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 2, size=(5, 4, 4, 4, 4)).astype(np.float32)
+
+
+def test_value_only_matches_predict(net, states):
+    _, values = net.predict(states)
+    np.testing.assert_allclose(net.value_only(states), values, rtol=1e-5, atol=1e-6)
+
+
+def test_policy_only_matches_predict(net, states):
+    policy, _ = net.predict(states)
+    np.testing.assert_allclose(net.policy_only(states), policy, rtol=1e-5, atol=1e-6)
+
+
+def test_value_fn_matches_value_head(net, new_board):
+    board = new_board()
+    board.do_move(21)
+    state = board.current_state().reshape(1, 4, 4, 4, 4)
+    assert np.isclose(net.value_fn(board), net.predict(state)[1][0][0], atol=1e-6)
@@ -0,0 +1,24 @@
+import threading
+
+from alphazero.mcts_alphaZero_3d import MCTS3D
+from alphazero.ponder import Ponderer
+
+
+def test_tree_kept_when_no_ponder_slot_is_free(uniform_policy_value_fn, new_board):
+    mcts = MCTS3D(uniform_policy_value_fn, 200)
+    board = new_board()
+    mcts.get_move_probs(board)
+    ponderer = Ponderer(mcts, slots=threading.Semaphore(0))
+    assert not ponderer.start(board, [])
+    move = max(mcts.last_visits, key=mcts.last_visits.get)
+    assert ponderer.take_tree([move]) == mcts.last_visits[move]
+
+
+def test_miss_resets_tree(uniform_policy_value_fn, new_board):
+    mcts = MCTS3D(uniform_policy_value_fn, 200)
+    board = new_board()
+    mcts.get_move_probs(board)
+    ponderer = Ponderer(mcts, slots=threading.Semaphore(0))
+    ponderer.start(board, [])
+    assert ponderer.take_tree([0, 1]) is None
+    assert mcts._root.is_leaf()
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from alphazero import runtime_config
+from alphazero.runtime_config import parse_cpu_list, runtime_settings
+
+
+@pytest.fixture
+def cpus(monkeypatch):
+    monkeypatch.setattr(runtime_config, 'available_cpus', lambda: list(range(8)))
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    for name in ('GOMOKU_TF_INTRA_OP_THREADS', 'GOMOKU_TF_INTER_OP_THREADS',
+                 'GOMOKU_CPU_AFFINITY', 'GOMOKU_WORKER_INDEX', 'GOMOKU_RUNTIME_CONFIG'):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('0-3,8', [0, 1, 2, 3, 8]),
+    ('5', [5]),
+    (' 2,1,2 ', [1, 2]),
+])
+def test_parse_cpu_list(spec, expected):
+    assert parse_cpu_list(spec) == expected
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('slice:0/4', [0, 1]),
+    ('slice:3/4', [6, 7]),
+    ('slice:2/16', [2]),
+])
+def test_parse_cpu_slice(cpus, spec, expected):
+    assert parse_cpu_list(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['', ',', 'slice:4/4', 'slice:-1/2'])
+def test_parse_invalid_cpu_list(cpus, spec):
+    with pytest.raises(ValueError):
+        parse_cpu_list(spec)
+
+
+def test_worker_index_selects_slice_of_tuned_workers(clean_env, tmp_path):
+    path = tmp_path / 'runtime.json'
+    path.write_text(json.dumps({'intra_op_threads': 2, 'workers': 4}))
+    clean_env.setenv('GOMOKU_RUNTIME_CONFIG', str(path))
+    clean_env.setenv('GOMOKU_WORKER_INDEX', '3')
+    settings = runtime_settings()
+    assert settings['intra_op_threads'] == 2
+    assert settings['cpu_affinity'] == 'slice:3/4'
+
+
+def test_explicit_affinity_wins_over_worker_index(clean_env):
+    clean_env.setenv('GOMOKU_CPU_AFFINITY', '0-1')
+    settings = runtime_settings(workers=4, worker_index=1)
+    assert settings['cpu_affinity'] == '0-1'
+
+
+def test_no_pinning_without_worker_index(clean_env):
+    assert runtime_settings(workers=4)['cpu_affinity'] is None